@@ -1,3 +1,5 @@
 """
 lox programming language
-"""
\ No newline at end of file
+"""
+
+__version__ = "0.1"
@@ -0,0 +1,108 @@
+"""
+on-disk cache of parsed programs, similar to __pycache__
+
+The parsed (not yet resolved) statement list of a script is pickled into a __loxcache__ directory next to it, in a
+file named after the script, the python implementation, the plox version and the hash of the source. Entries are
+checked against the same key when loaded, written atomically, and the directory is kept under MAX_CACHE_BYTES by
+evicting the least recently used entries. Like .pyc files, cache entries are trusted: don't run scripts from
+directories you wouldn't import python code from.
+"""
+
+from typing import List, Optional
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+import lox
+from lox import stmt
+
+
+CACHE_DIRECTORY = '__loxcache__'
+MAGIC = b'plox-cache'
+FORMAT = 4 # bump when the layout of stmt/expr nodes, or what the lexer and parser produce from a source, changes
+MAX_CACHE_BYTES = 16 * 1024 * 1024
+
+
+
+def source_hash(source : str) -> str:
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def cache_path(file : str, source : str) -> str:
+    """where the cache entry for this version of `file` lives"""
+    directory, name = os.path.split(os.path.abspath(file))
+    return os.path.join(directory, CACHE_DIRECTORY,
+                        f"{name}.{sys.implementation.cache_tag}.plox-{lox.__version__}-{FORMAT}.{source_hash(source)[:16]}.pickle")
+
+
+def load(file : str, source : str) -> Optional[List[stmt.Stmt]]:
+    """return the cached statements for `source`, or None if there is no valid entry"""
+    path = cache_path(file, source)
+    try:
+        with open(path, 'rb') as f:
+            magic, format, version, digest, statements = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        discard(path)
+        return None
+
+    if (magic != MAGIC or format != FORMAT or version != lox.__version__ or digest != source_hash(source)
+            or type(statements) != list or not all(isinstance(i, stmt.Stmt) for i in statements)):
+        discard(path)
+        return None
+
+    try:
+        os.utime(path) # mark as recently used for eviction
+    except OSError:
+        pass
+    return statements
+
+
+def store(file : str, source : str, statements : List[stmt.Stmt]) -> None:
+    """atomically write the cache entry for `source`, then trim the cache directory. failures are ignored"""
+    path = cache_path(file, source)
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            pickle.dump((MAGIC, FORMAT, lox.__version__, source_hash(source), statements), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except Exception: # unwritable directory, or a tree too deep to pickle
+        discard(temporary)
+        return
+
+    evict(directory)
+
+
+def evict(directory : str, max_bytes : int = MAX_CACHE_BYTES) -> None:
+    """remove least recently used entries until the directory holds at most max_bytes"""
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith('.pickle'):
+            try:
+                status = entry.stat()
+            except OSError:
+                continue
+            entries.append((status.st_mtime, status.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        discard(path)
+        total -= size
+
+
+def discard(path : str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,46 +1,54 @@
+from typing import Dict, List
 
 
-class Environment: 
-    
+class Undefined:
+    """marker for a slot whose variable has been resolved but not yet defined at runtime"""
 
-    def __init__(self, parent, enclosing = None): 
-        self.environment = {}
-        self.parent = parent 
-        self.enclosing = enclosing 
-    
     def __repr__(self):
-        return self.environment.__repr__() + " " + str(self.enclosing)
-
-    
-    def define(self, name, value) -> None:
-        self.environment[name] = value 
-    
-    def get(self, name):
-        try:
-            return self.environment[name]
-        except: 
-            try: 
-                if self.enclosing: 
-                    return self.enclosing.get(name)
-                else:
-                    raise EOFError
-                    #self.parent.report("Variables must be declared before use!")
-            except:
-                self.parent.report("Variables must be declared before use!")
-    
-    def set(self, name, value):
-        try:
-            x = self.environment[name]
-            self.environment[name] = value 
-            return self.environment[name] 
-        except: 
-            try:
-                if self.enclosing: 
-                    return self.enclosing.set(name, value)
-            except: 
-                self.parent.report("Variables must be declared before use!")
-    
-    def copy(self):
-        new = Environment(self.parent, self.enclosing)
-        new.environment = self.environment
-        return new
\ No newline at end of file
+        return "<undefined>"
+
+UNDEFINED = Undefined()
+
+
+
+class Environment:
+    """a single scope frame. variables live in a fixed-size list, at the slot assigned to them by the Resolver"""
+
+    __slots__ = ('values', 'enclosing')
+
+    def __init__(self, enclosing = None, size : int = 0):
+        self.values : List = [UNDEFINED] * size
+        self.enclosing = enclosing
+
+    def __repr__(self):
+        return self.values.__repr__() + " " + str(self.enclosing)
+
+    def ancestor(self, depth : int) -> 'Environment':
+        environment = self
+        for _ in range(depth):
+            environment = environment.enclosing
+        return environment
+
+
+
+class GlobalEnvironment(Environment):
+    """the outermost frame. globals are also slot-indexed, but keep a name -> slot table so that the Resolver
+    (and native functions) can find them, and so that it can grow across REPL lines"""
+
+    __slots__ = ('slots',)
+
+    def __init__(self):
+        super().__init__()
+        self.slots : Dict[str, int] = {}
+
+    def declare(self, name : str) -> int:
+        if name not in self.slots:
+            self.slots[name] = len(self.values)
+            self.values.append(UNDEFINED)
+        return self.slots[name]
+
+    def define(self, name : str, value) -> None:
+        self.values[self.declare(name)] = value
+
+    def get(self, name : str):
+        return self.values[self.slots[name]]
@@ -1,14 +1,45 @@
+from typing import Optional
+
 from lox import state
-from lox import utils 
+from lox import utils
+
+
+
+class LoxError(Exception):
+    """
+    an error in a Lox program, as reported to the user. Every report is recorded on the current state. Fatal ones
+    (lex, parse and runtime errors) are then raised to abandon the program, and caught by run.run
+    """
+
+    def __init__(self, type : str, message : str, file : str, line : Optional[int], column : Optional[int] = None):
+        super().__init__(f"{type}: {message}")
+        self.type = type
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+
+    def as_dict(self) -> dict:
+        return {'type' : self.type, 'message' : self.message, 'file' : self.file, 'line' : self.line, 'column' : self.column}
+
+
+def record(type : str, message : str, file : str, line : Optional[int], column : Optional[int] = None) -> LoxError:
+    """flag the current state as failed and remember the error on it"""
+    error = LoxError(type, message, file, line, column)
+    current = state.current()
+    current.error_flag = True
+    current.errors.append(error)
+    return error
 
 
 def report(type: str, file: str , line: int, column: int, message:str) -> None:
-    print(f"file {file}, line {line}, column {column}")
-    print(f"{utils.nth_line_of_string(state.currently_executing_program, line)}")
-    print(" " * column + "^")
-    print(f"{type}: {message}")
+    if state.current().echo:
+        print(f"file {file}, line {line}, column {column}")
+        print(f"{utils.nth_line_of_string(state.current().currently_executing_program, line)}")
+        print(" " * column + "^")
+        print(f"{type}: {message}")
     #print("[line " + str(line+1) + "] Error" + where + ": " + message)
-    state.error_flag = True 
+    record(type, message, file, line, column)
 
 """def error(type,file,position,row,column,message):
-    report(row, "", message)"""
\ No newline at end of file
+    report(row, "", message)"""
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Protocol, TypeVar, List 
 
 from lox.tokens import Token 
@@ -52,6 +52,10 @@ class Visitor(Protocol[R]):
     
 
 class Expr(ABC): 
+
+    # source position of the first token of the expression (1-based line, 0-based column), set by the Parser
+    line : int = None 
+    column : int = None 
     
     @abstractmethod
     def accept(self, visitor: Visitor[R]) -> R:
@@ -126,6 +130,8 @@ class Unary(Expr):
 @dataclass
 class Variable(Expr):
     name : Token 
+    depth : int = field(default=None, repr=False, compare=False) #set by the Resolver, None for globals
+    slot : int = field(default=None, repr=False, compare=False)
 
     def accept(self, visitor: Visitor[R]) -> R:
         return visitor.visit_variable_exression(self)
@@ -151,6 +157,7 @@ class ListExpr(Expr):
 class Lambda(Expr):
     parameters : List[Token]
     expression : Expr 
+    size : int = field(default=0, repr=False, compare=False) #number of slots in the lambda's frame
 
     def accept(self, visitor: Visitor[R]) -> R:
         return visitor.visit_lambda_expression(self)
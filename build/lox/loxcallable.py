@@ -3,13 +3,22 @@ from functools import reduce
 from time import time 
 
 from lox import utils 
+from lox import tokens 
 from lox import stmt, expr 
 from lox import environment
 
 
-class Return_Exception(Exception):
-    def __init__(self, value=None):
-        self.value = value
+class TailCall:
+    """
+    what a `return f(...)` inside a function completes with instead of a value: the (already checked) call to make
+    once the current call has been unwound, so tail recursion loops in Interpreter.call_function instead of nesting
+    """
+
+    __slots__ = ('function', 'arguments')
+
+    def __init__(self, function, arguments : List):
+        self.function = function
+        self.arguments = arguments
 
 
 class LoxCallable(Protocol): 
@@ -97,12 +106,43 @@ class Printf(LoxCallable):
         return "<native fn printf>"
 
 
+def check_sequence(interpreter, value, caller : str):
+    """check that a native list function was given a list (or a string, which indexes like one)"""
+    if type(value) not in (list, str):
+        interpreter.report(f"{caller} expects a list, not {utils.loxify(value)}!")
+    return value
+
+
+def native_caller(interpreter, value, arguments : int, caller : str):
+    """check once that a native list function was given something callable with `arguments` arguments, and return
+    a python function calling it, so the per element calls skip the checks Interpreter.call does every time"""
+    if not hasattr(value, "call"):
+        interpreter.report(f"{caller} expects a function, not {utils.loxify(value)}!")
+    if value.arity() != arguments:
+        interpreter.report(f"{caller} expects a function of {arguments} argument{'s' if arguments > 1 else ''}, not {value.arity()}")
+    call = value.call
+    if arguments == 1:
+        return lambda x : call(interpreter, [x])
+    return lambda x, y : call(interpreter, [x, y])
+
+
+def all_numbers(values) -> bool:
+    """true if every element is a number, so the whole operation can run in python instead of per element.
+    booleans are not numbers here, even though python would happily add and compare them"""
+    return set(map(type, values)) == {float}
+
+
 class ListInsert(LoxCallable):
 
     def call(self, interpreter, arguments): 
         l = arguments[0]
         index = arguments[1]
         value = arguments[2]
+        if type(l) != list:
+            interpreter.report(f"list_insert expects a list, not {utils.loxify(l)}!")
+        if type(index) != float:
+            interpreter.report("list_insert expects a numeric index!")
+        l.insert(int(index), value)
 
     def arity(self) -> int: 
         return 3
@@ -111,10 +151,25 @@ class ListInsert(LoxCallable):
         return "<native fn list_insert>"
 
 
+class Append(LoxCallable):
+
+    def call(self, interpreter, arguments): 
+        if type(arguments[0]) != list:
+            interpreter.report(f"append expects a list, not {utils.loxify(arguments[0])}!")
+        arguments[0].append(arguments[1])
+
+    def arity(self) -> int: 
+        return 2
+
+    def __repr__(self) -> str: 
+        return "<native fn append>"
+
+
 class Map(LoxCallable):
 
     def call(self, interpreter, arguments):
-        pass 
+        mapper, values = native_caller(interpreter, arguments[0], 1, "map"), check_sequence(interpreter, arguments[1], "map")
+        return list(map(mapper, values))
 
     def arity(self) -> int: 
         return 2 
@@ -126,7 +181,8 @@ class Map(LoxCallable):
 class Filter(LoxCallable):
 
     def call(self, interpreter, arguments):
-        pass 
+        predicate, values = native_caller(interpreter, arguments[0], 1, "filter"), check_sequence(interpreter, arguments[1], "filter")
+        return list(filter(predicate, values))
 
     def arity(self) -> int: 
         return 2 
@@ -138,7 +194,10 @@ class Filter(LoxCallable):
 class Reduce(LoxCallable):
 
     def call(self, interpreter, arguments):
-        pass 
+        reducer, values = native_caller(interpreter, arguments[0], 2, "reduce"), check_sequence(interpreter, arguments[1], "reduce")
+        if not values:
+            interpreter.report("Can't reduce an empty list!")
+        return reduce(reducer, values)
 
     def arity(self) -> int: 
         return 2 
@@ -147,6 +206,53 @@ class Reduce(LoxCallable):
         return "<native fn reduce>"
 
 
+class Range(LoxCallable):
+
+    def call(self, interpreter, arguments):
+        start, stop = arguments
+        if type(start) != float or type(stop) != float:
+            interpreter.report("range expects two numbers!")
+        return [float(i) for i in range(int(start), int(stop))]
+
+    def arity(self) -> int: 
+        return 2 
+    
+    def __repr__(self) -> str:
+        return "<native fn range>"
+
+
+class Sum(LoxCallable):
+
+    def call(self, interpreter, arguments):
+        values = check_sequence(interpreter, arguments[0], "sum")
+        if all_numbers(values):
+            return sum(values, 0.0)
+        if not values:
+            return 0.0
+        return reduce(tokens.OPERATIONS[tokens.TokenType.PLUS], values) # same semantics (and errors) as a loop of +
+
+    def arity(self) -> int: 
+        return 1
+    
+    def __repr__(self) -> str:
+        return "<native fn sum>"
+
+
+class Sort(LoxCallable):
+
+    def call(self, interpreter, arguments):
+        values = check_sequence(interpreter, arguments[0], "sort")
+        if not (all_numbers(values) or set(map(type, values)) <= {str}):
+            interpreter.report("sort expects a list of numbers or a list of strings!")
+        return sorted(values)
+
+    def arity(self) -> int: 
+        return 1
+    
+    def __repr__(self) -> str:
+        return "<native fn sort>"
+
+
 class Len(LoxCallable):
 
     def call(self, interpreter, arguments):
@@ -166,13 +272,14 @@ class LoxFunction(LoxCallable):
         self.closure = closure
 
     def call(self, interpreter, arguments): 
-        envy = environment.Environment(interpreter, self.closure)
-        for i in range(len(self.declaration.params)):
-            envy.define(self.declaration.params[i].name.value, arguments[i]) 
-        try:
-            interpreter.execute_block(self.declaration.body, envy)
-        except Return_Exception as retex:
-            return retex.value
+        return interpreter.call_function(self, arguments)
+
+    def execute(self, interpreter, arguments):
+        """run the body once, returning its completion: None, a 1-tuple holding the returned value, or a TailCall"""
+        envy = environment.Environment(self.closure, self.declaration.size)
+        for parameter, argument in zip(self.declaration.params, arguments):
+            envy.values[parameter.slot] = argument 
+        return interpreter.execute_block(self.declaration.body, envy)
 
     def arity(self) -> int: 
         return len(self.declaration.params)  
@@ -184,22 +291,22 @@ class LoxFunction(LoxCallable):
 
 class LoxLambda(LoxCallable):
 
-    def __init__(self, expression : expr.Lambda):
+    def __init__(self, expression : expr.Lambda, closure):
         self.expression = expression 
+        self.closure = closure
 
     def call(self, interpreter, arguments):
-        envy = environment.Environment(interpreter, interpreter.globals)
-        for i in range(len(self.expression.parameters)):
-            envy.define(self.expression.parameters[i].name.value, arguments[i])      
+        return interpreter.call_function(self, arguments)
 
-        try:   
-            #print(interpreter.evaluate_block(self.expression.expression, envy))
-            return interpreter.evaluate_block(self.expression.expression, envy)
-        except Return_Exception as retex:
-            return retex.value
+    def execute(self, interpreter, arguments):
+        """evaluate the body once, returning its completion: a 1-tuple holding the value, or a TailCall"""
+        envy = environment.Environment(self.closure, self.expression.size)
+        for parameter, argument in zip(self.expression.parameters, arguments):
+            envy.values[parameter.slot] = argument 
+        return interpreter.evaluate_tail(self.expression.expression, envy)
 
     def arity(self) -> int:
         return len(self.expression.parameters) 
 
     def __repr__(self) -> str: 
-        return f"<user-defined anonymous function>"
\ No newline at end of file
+        return f"<user-defined anonymous function>"
@@ -0,0 +1,539 @@
+from typing import Any, Callable, List, Optional
+
+from lox import tokens
+from lox import expr
+from lox import stmt
+from lox.environment import Environment, UNDEFINED
+from lox.loxcallable import LoxCallable, Print, Printf, TailCall
+
+
+# a compiled expression takes the current frame and returns a value. a compiled statement takes the current frame
+# and returns None, a 1-tuple holding the value of a `return` that should unwind to the enclosing function, or a
+# TailCall for a `return f(...)` that the enclosing function should make in its place
+CompiledExpr = Callable[[Environment], Any]
+CompiledStmt = Callable[[Environment], Optional[tuple]]
+
+
+
+class CompiledFunction(LoxCallable):
+    """a user-defined function (or lambda) whose body has been compiled to a closure"""
+
+    def __init__(self, name : tokens.Token, params : List[expr.Variable], size : int, body : CompiledStmt, closure : Environment, interpreter):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.closure = closure
+        self.size = size
+        self.interpreter = interpreter
+        self.argument_count = len(params)
+        # the common case: parameters occupy the first slots of the frame, in order
+        self.positional = [parameter.slot for parameter in params] == list(range(len(params)))
+        self.padding = [UNDEFINED] * (size - len(params))
+
+    def invoke(self, arguments : List, overflow : Callable[[], None]):
+        """call with already checked arguments, then make whatever the body tail calls, in a loop.
+        overflow reports a stack overflow at the call site"""
+        interpreter = self.interpreter
+        if interpreter.depth >= interpreter.max_depth:
+            overflow()
+        interpreter.depth += 1
+        function = self
+        try:
+            while True:
+                envy = Environment(function.closure)
+                if function.positional:
+                    envy.values = arguments + function.padding
+                else:
+                    envy.values = [UNDEFINED] * function.size
+                    for parameter, argument in zip(function.params, arguments):
+                        envy.values[parameter.slot] = argument
+                returned = function.body(envy)
+                if type(returned) is not TailCall:
+                    return returned[0] if returned is not None else None
+                function, arguments = returned.function, returned.arguments
+        finally:
+            interpreter.depth -= 1
+
+    def call(self, interpreter, arguments):
+        return self.invoke(arguments, lambda : interpreter.report("stack overflow"))
+
+    def arity(self) -> int:
+        return self.argument_count
+
+    def __repr__(self) -> str:
+        if self.name is None:
+            return f"<user-defined anonymous function>"
+        return f"<user-defined fn {self.name}>"
+
+
+
+class ClosureCompiler(expr.Visitor[CompiledExpr], stmt.Visitor[CompiledStmt]):
+    """
+    Alternative execution engine: turns a resolved program into a tree of specialized python closures, once,
+    ahead of time. This removes the accept -> visit_* dispatch, the OPERATIONS lookup on every binary operation and
+    the per-run desugaring of loops that the tree-walking Interpreter performs.
+
+    The compiler shares the Interpreter's globals, so natives and the REPL work the same way under both engines.
+    Runtime errors are reported through the Interpreter, pointing at the innermost statement being compiled.
+    """
+
+    def __init__(self, interpreter) -> None:
+        self.interpreter = interpreter
+        self.globals = interpreter.globals
+        self.current_statement : stmt.Stmt = None
+        self.function_depth : int = 0 # how many function bodies the code being compiled is nested in
+
+
+    def execute(self, statements : List[stmt.Stmt]) -> None:
+        """compile the whole program first, then run it against the interpreter's globals"""
+        program = [(statement, self.compile_statement(statement)) for statement in statements]
+        for statement, compiled in program:
+            self.interpreter.last_executed_statement = statement
+            if compiled(self.globals) is not None:
+                break
+            self.interpreter.last_line += 1
+
+
+    # HELPER FUNCTIONS
+
+    def compile_statement(self, statement : stmt.Stmt) -> CompiledStmt:
+        enclosing_statement = self.current_statement
+        self.current_statement = statement
+        try:
+            return statement.accept(self)
+        finally:
+            self.current_statement = enclosing_statement
+
+
+    def compile_expression(self, expression : expr.Expr) -> CompiledExpr:
+        return expression.accept(self)
+
+
+    def compile_sequence(self, statements : List[stmt.Stmt]) -> CompiledStmt:
+        compiled = [self.compile_statement(statement) for statement in statements]
+
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def sequence(envy):
+            for statement in compiled:
+                returned = statement(envy)
+                if returned is not None:
+                    return returned
+        return sequence
+
+
+    def error(self, message : str) -> Callable[[], None]:
+        """build a reporter for a runtime error raised by the statement currently being compiled"""
+        interpreter = self.interpreter
+        statement = self.current_statement
+
+        def report():
+            interpreter.last_executed_statement = statement
+            interpreter.report(message)
+        return report
+
+
+    def frame_getter(self, depth : int) -> Callable[[Environment], Environment]:
+        if depth == 0:
+            return lambda envy : envy
+        if depth == 1:
+            return lambda envy : envy.enclosing
+        return lambda envy : envy.ancestor(depth)
+
+
+    # STATEMENTS
+
+    def visit_block_statement(self, s : stmt.Block) -> CompiledStmt:
+        body = self.compile_sequence(s.statements)
+        size = s.size
+
+        def block(envy):
+            return body(Environment(envy, size))
+        return block
+
+
+    def visit_if_statement(self, s : stmt.If) -> CompiledStmt:
+        condition = self.compile_expression(s.condition)
+        then_branch = self.compile_statement(s.statement)
+
+        if not s.else_branch:
+            def if_statement(envy):
+                if condition(envy):
+                    return then_branch(envy)
+            return if_statement
+
+        else_branch = self.compile_statement(s.else_branch)
+
+        def if_else_statement(envy):
+            if condition(envy):
+                return then_branch(envy)
+            return else_branch(envy)
+        return if_else_statement
+
+
+    def visit_while_statement(self, s : stmt.While) -> CompiledStmt:
+        condition = self.compile_expression(s.condition)
+        body = self.compile_statement(s.statement)
+
+        def while_statement(envy):
+            while condition(envy):
+                returned = body(envy)
+                if returned is not None:
+                    return returned
+        return while_statement
+
+
+    def visit_for_statement(self, s : stmt.For) -> CompiledStmt:
+        if isinstance(s.init, expr.Expr):
+            initializer = self.compile_expression(s.init)
+        else:
+            initializer = self.compile_statement(s.init)
+        condition = self.compile_expression(s.condition) if s.condition is not None else (lambda envy : True)
+        increment = self.compile_expression(s.iter) if s.iter is not None else (lambda envy : None)
+        body = self.compile_statement(s.statement)
+        size = s.size
+
+        def for_statement(envy):
+            frame = Environment(envy, size)
+            initializer(frame)
+            while condition(frame):
+                returned = body(frame)
+                if returned is not None:
+                    return returned
+                increment(frame)
+        return for_statement
+
+
+    def visit_foreach_statement(self, s : stmt.ForEach) -> CompiledStmt:
+        iterable = self.compile_expression(s.listvar)
+        body = self.compile_statement(s.statement)
+        size, slot = s.size, s.itervar.slot
+
+        def foreach_statement(envy):
+            for i in range(len(iterable(envy))):
+                frame = Environment(envy, size)
+                frame.values[slot] = iterable(envy)[i]
+                returned = body(frame)
+                if returned is not None:
+                    return returned
+        return foreach_statement
+
+
+    def visit_expression_statement(self, s : stmt.Expression) -> CompiledStmt:
+        expression = self.compile_expression(s.expression)
+
+        def expression_statement(envy):
+            expression(envy)
+        return expression_statement
+
+
+    def visit_variable_statement(self, s : stmt.Var) -> CompiledStmt:
+        initializer = self.compile_expression(s.initializer) if s.initializer is not None else (lambda envy : None)
+        slot = s.slot
+
+        def variable_statement(envy):
+            envy.values[slot] = initializer(envy)
+        return variable_statement
+
+
+    def visit_blank_statement(self, s : stmt.Blank) -> CompiledStmt:
+        return lambda envy : None
+
+
+    def visit_function_statement(self, s : stmt.Function) -> CompiledStmt:
+        self.function_depth += 1
+        body = self.compile_sequence(s.body)
+        self.function_depth -= 1
+        name, params, size, slot = s.name, s.params, s.size, s.slot
+        interpreter = self.interpreter
+
+        def function_statement(envy):
+            envy.values[slot] = CompiledFunction(name, params, size, body, envy, interpreter)
+        return function_statement
+
+
+    def visit_return_statement(self, s : stmt.Return) -> CompiledStmt:
+        if s.value is None:
+            return lambda envy : (None,)
+        if type(s.value) is expr.Call and self.function_depth:
+            return self.compile_tail_call(s.value)
+        value = self.compile_expression(s.value)
+        return lambda envy : (value(envy),)
+
+
+    def compile_tail_call(self, e : expr.Call) -> CompiledStmt:
+        """`return f(...)`: complete with a TailCall to user-defined functions, call anything else right away"""
+        callee = self.compile_expression(e.callee)
+        arguments = [self.compile_expression(argument) for argument in e.arguments]
+        call = self.call_value()
+        argument_count = len(arguments)
+
+        def tail_call(envy):
+            function = callee(envy)
+            values = [argument(envy) for argument in arguments]
+            if type(function) is CompiledFunction and function.argument_count == argument_count:
+                return TailCall(function, values)
+            return (call(function, values),)
+        return tail_call
+
+
+    def visit_decorator_statement(self, s : stmt.Decorator) -> CompiledStmt:
+        decorator = self.compile_expression(s.decorator)
+        function = self.compile_statement(s.function)
+        declaration = s.function
+        while isinstance(declaration, stmt.Decorator):
+            declaration = declaration.function
+        slot = declaration.slot
+        call = self.call_value()
+
+        def decorator_statement(envy):
+            decorate = decorator(envy)
+            function(envy)
+            envy.values[slot] = call(decorate, [envy.values[slot]])
+        return decorator_statement
+
+
+    # EXPRESSIONS
+
+    def visit_binary_expression(self, e : expr.Binary) -> CompiledExpr:
+        left = self.compile_expression(e.left)
+        right = self.compile_expression(e.right)
+        fallback = tokens.OPERATIONS[e.operator.type] # handles (and reports) mixed operand types
+
+        match e.operator.type:
+            case tokens.TokenType.PLUS:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a + b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.MINUS:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a - b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.LESSER:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a < b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.LESSER_EQUAL:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a <= b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.GREATER:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a > b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.GREATER_EQUAL:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a >= b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.EQUAL_EQUAL:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a == b if type(a) is type(b) else fallback(a, b)
+            case tokens.TokenType.BANG_EQUAL:
+                def binary(envy):
+                    a, b = left(envy), right(envy)
+                    return a != b if type(a) is type(b) else fallback(a, b)
+            case _:
+                def binary(envy):
+                    return fallback(left(envy), right(envy))
+        return binary
+
+
+    def visit_call_expression(self, e : expr.Call) -> CompiledExpr:
+        callee = self.compile_expression(e.callee)
+        arguments = [self.compile_expression(argument) for argument in e.arguments]
+        call = self.call_value()
+        argument_count = len(arguments)
+        overflow = self.error("stack overflow")
+
+        def call_expression(envy):
+            function = callee(envy)
+            values = [argument(envy) for argument in arguments]
+            if type(function) is CompiledFunction and function.argument_count == argument_count:
+                return function.invoke(values, overflow)
+            return call(function, values)
+        return call_expression
+
+
+    def call_value(self) -> Callable[[Any, List], Any]:
+        """generic call path, shared by calls and decorators. checks the callee and its arity like Interpreter.call"""
+        interpreter = self.interpreter
+        not_callable = self.error("can't call a non-callable object")
+        statement = self.current_statement
+
+        def call(function, values):
+            if not hasattr(function, "call"):
+                not_callable()
+            if not (isinstance(function, Print) or isinstance(function, Printf)) and len(values) != function.arity():
+                interpreter.last_executed_statement = statement
+                interpreter.report(f"The function expected {function.arity()} arguments but received {len(values)} arguments")
+            return function.call(interpreter, values)
+        return call
+
+
+    def visit_logical_expression(self, e : expr.Logical) -> CompiledExpr:
+        left = self.compile_expression(e.left)
+        right = self.compile_expression(e.right)
+
+        if e.operator.type == tokens.TokenType.OR:
+            def logical(envy):
+                return left(envy) or right(envy)
+        else:
+            def logical(envy):
+                return left(envy) and right(envy)
+        return logical
+
+
+    def visit_grouping_expression(self, e : expr.Grouping) -> CompiledExpr:
+        return self.compile_expression(e.expression)
+
+
+    def visit_literal_expression(self, e : expr.Literal) -> CompiledExpr:
+        value = e.value
+        return lambda envy : value
+
+
+    def visit_unary_expression(self, e : expr.Unary) -> CompiledExpr:
+        right = self.compile_expression(e.right)
+
+        if e.operator.type == tokens.TokenType.BANG:
+            return lambda envy : not right(envy)
+
+        if e.operator.type == tokens.TokenType.MINUS:
+            negation_error = self.error("Can't negate a non-numeric value!")
+
+            def negate(envy):
+                value = right(envy)
+                if type(value) == float:
+                    return -value
+                negation_error()
+            return negate
+
+        return lambda envy : None
+
+
+    def visit_variable_exression(self, e : expr.Variable) -> CompiledExpr:
+        slot = e.slot
+
+        if e.depth is None:
+            values = self.globals.values
+            undeclared = self.error("Variables must be declared before use!")
+
+            def global_variable(envy):
+                value = values[slot]
+                if value is UNDEFINED:
+                    undeclared()
+                return value
+            return global_variable
+
+        # a local function is hoisted (see Resolver.hoist), so it can be read before its declaration has run
+        undeclared = self.error("Variables must be declared before use!")
+
+        if e.depth == 0:
+            def local_variable(envy):
+                value = envy.values[slot]
+                if value is UNDEFINED:
+                    undeclared()
+                return value
+            return local_variable
+
+        if e.depth == 1:
+            def enclosing_variable(envy):
+                value = envy.enclosing.values[slot]
+                if value is UNDEFINED:
+                    undeclared()
+                return value
+            return enclosing_variable
+
+        depth = e.depth
+
+        def ancestor_variable(envy):
+            value = envy.ancestor(depth).values[slot]
+            if value is UNDEFINED:
+                undeclared()
+            return value
+        return ancestor_variable
+
+
+    def visit_assignment_expression(self, e : expr.Assignment) -> CompiledExpr:
+        value = self.compile_expression(e.expression)
+        slot = e.name.slot
+
+        if e.name.depth is None:
+            values = self.globals.values
+            undeclared = self.error("Variables must be declared before use!")
+
+            def global_assignment(envy):
+                if values[slot] is UNDEFINED:
+                    undeclared()
+                values[slot] = result = value(envy)
+                return result
+            return global_assignment
+
+        frame = self.frame_getter(e.name.depth)
+        undeclared = self.error("Variables must be declared before use!")
+
+        def assignment(envy):
+            values = frame(envy).values
+            if values[slot] is UNDEFINED:
+                undeclared()
+            values[slot] = result = value(envy)
+            return result
+        return assignment
+
+
+    def visit_index_expression(self, e : expr.Index) -> CompiledExpr:
+        array = self.compile_expression(e.list)
+        index = self.compile_expression(e.index)
+        index_error = self.error("Couldn't perform indexing")
+
+        def index_expression(envy):
+            a, i = array(envy), index(envy)
+            try:
+                return a[int(i)]
+            except:
+                index_error()
+        return index_expression
+
+
+    def visit_slice_expression(self, e : expr.Slice) -> CompiledExpr:
+        array = self.compile_expression(e.list)
+        start = self.compile_expression(e.start)
+        stop = self.compile_expression(e.stop)
+        step = self.compile_expression(e.step)
+        slice_error = self.error("can't slice dat")
+
+        def slice_expression(envy):
+            a, i, j, k = array(envy), start(envy), stop(envy), step(envy)
+            try:
+                return list(a[int(i) : int(j) : int(k)])
+            except:
+                slice_error()
+        return slice_expression
+
+
+    def visit_list_expression(self, e : expr.ListExpr) -> CompiledExpr:
+        elements = [self.compile_expression(element) for element in e.value]
+        return lambda envy : [element(envy) for element in elements]
+
+
+    def visit_lambda_expression(self, e : expr.Lambda) -> CompiledExpr:
+        self.function_depth += 1
+        if type(e.expression) is expr.Call:
+            body = self.compile_tail_call(e.expression)
+        else:
+            expression = self.compile_expression(e.expression)
+            def body(envy):
+                return (expression(envy),)
+        self.function_depth -= 1
+        params, size, interpreter = e.parameters, e.size, self.interpreter
+
+        return lambda envy : CompiledFunction(None, params, size, body, envy, interpreter)
+
+
+    def visit_ternary_expression(self, e : expr.Ternary) -> CompiledExpr:
+        condition = self.compile_expression(e.condition)
+        if_true = self.compile_expression(e.if_condition)
+        if_false = self.compile_expression(e.else_condition)
+        return lambda envy : if_true(envy) if condition(envy) else if_false(envy)
@@ -0,0 +1,626 @@
+from array import array
+from typing import Any, Dict, List, Optional
+import enum
+import sys
+
+from lox import tokens
+from lox import expr
+from lox import stmt
+from lox.environment import UNDEFINED
+
+
+
+class OpCode(enum.IntEnum):
+    """
+    Instructions are fixed width: an opcode followed by a single integer operand (0 when unused).
+    Jump operands are absolute instruction offsets.
+    """
+
+    CONSTANT = 0            # push constants[operand]
+    POP = 1
+    GET_LOCAL = 2           # push stack[base + operand]
+    SET_LOCAL = 3           # stack[base + operand] = top (value stays on the stack)
+    GET_GLOBAL = 4          # push globals.values[operand]
+    SET_GLOBAL = 5
+    DEFINE_GLOBAL = 6       # globals.values[operand] = pop()
+    GET_UPVALUE = 7
+    SET_UPVALUE = 8
+    ADD = 9
+    SUBTRACT = 10
+    MULTIPLY = 11
+    DIVIDE = 12
+    EQUAL = 13
+    NOT_EQUAL = 14
+    GREATER = 15
+    GREATER_EQUAL = 16
+    LESS = 17
+    LESS_EQUAL = 18
+    NOT = 19
+    NEGATE = 20
+    JUMP = 21
+    POP_JUMP_IF_FALSE = 22
+    JUMP_IF_FALSE_OR_POP = 23
+    JUMP_IF_TRUE_OR_POP = 24
+    CALL = 25               # operand = argument count
+    CLOSURE = 26            # wrap constants[operand] (a Code object); followed by one (is_local, index) pair per upvalue
+    CLOSE_UPVALUE = 27
+    RETURN = 28
+    BUILD_LIST = 29         # operand = number of elements
+    INDEX = 30
+    SLICE = 31
+    LEN = 32
+    NIL = 33
+    TAIL_CALL = 34          # operand = argument count. `return f(...)`: reuse the calling frame for a VM closure
+    CHECK_DEFINED = 35      # report an error if the top of the stack is a hoisted local function not yet declared
+
+
+BINARY_OPCODES = {
+                    tokens.TokenType.PLUS: OpCode.ADD,
+                    tokens.TokenType.MINUS: OpCode.SUBTRACT,
+                    tokens.TokenType.TIMES: OpCode.MULTIPLY,
+                    tokens.TokenType.DIVIDED_BY: OpCode.DIVIDE,
+                    tokens.TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+                    tokens.TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+                    tokens.TokenType.GREATER: OpCode.GREATER,
+                    tokens.TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+                    tokens.TokenType.LESSER: OpCode.LESS,
+                    tokens.TokenType.LESSER_EQUAL: OpCode.LESS_EQUAL,
+                 }
+
+# the safified operations of the tree-walker, indexed by opcode. the vm falls back to them for mixed operand types
+BINARY_FALLBACKS = {opcode : tokens.OPERATIONS[tokentype] for tokentype, opcode in BINARY_OPCODES.items()}
+
+
+
+class Code:
+    """a compiled function body: instructions and source map in arrays, plus its constant pool"""
+
+    __slots__ = ('name', 'arity', 'upvalue_count', 'code', 'constants', 'lines', 'statements', 'ordinals', 'instructions')
+
+    def __init__(self, name : Optional[tokens.Token], arity : int) -> None:
+        self.name = name
+        self.arity = arity
+        self.upvalue_count : int = 0
+        self.code : array = array('i')
+        self.constants : List[Any] = []
+        self.lines : array = array('i')            # per instruction: index into statements
+        self.statements : List[stmt.Stmt] = []      # statements the instructions belong to, for error reports
+        self.ordinals : List[int] = []              # per statement: the top level statement it is part of
+        self.instructions : List[int] = None        # unpacked copy of code for the vm, see finish()
+
+    def finish(self) -> 'Code':
+        """called once the code is complete. indexing a list is about twice as fast as indexing an array, so the
+        vm dispatches on an unpacked copy of the instructions"""
+        self.instructions = self.code.tolist()
+        return self
+
+    def __repr__(self) -> str:
+        return f"<code {self.name.value if self.name else 'anonymous'}>"
+
+
+
+class Local:
+
+    __slots__ = ('name', 'depth', 'captured', 'hoisted')
+
+    def __init__(self, name : str, depth : int, hoisted : bool = False) -> None:
+        self.name = name
+        self.depth = depth
+        self.captured = False
+        self.hoisted = hoisted # a local function, declared (as UNDEFINED) before its declaration runs
+
+
+
+class FunctionState:
+    """compiler bookkeeping for the function currently being compiled, linked to the enclosing function's state"""
+
+    def __init__(self, code : Code, enclosing : Optional['FunctionState']) -> None:
+        self.code = code
+        self.enclosing = enclosing
+        self.locals : List[Local] = [Local('', 0)] # slot 0 holds the function being called
+        self.upvalues : List[tuple] = []
+        self.scope_depth : int = 0
+
+
+
+class Compiler(expr.Visitor[None], stmt.Visitor[None]):
+    """
+    Lowers a resolved program to bytecode for the stack VM (see lox/pipeline/vm.py).
+
+    Locals live on the VM stack and are addressed by slot, variables captured by inner functions become upvalues,
+    and globals are addressed by their slot in the interpreter's GlobalEnvironment (assigned by the Resolver).
+    """
+
+    def __init__(self, interpreter) -> None:
+        self.globals = interpreter.globals
+        self.function : FunctionState = None
+        self.current_statement : stmt.Stmt = None
+        self.ordinal : int = 0
+
+
+    def compile(self, statements : List[stmt.Stmt]) -> Code:
+        """entry point for compiling. returns the code object for the top level script"""
+        self.function = FunctionState(Code(None, 0), None)
+        self.function.code.statements.append(None)
+        self.function.code.ordinals.append(0)
+        for ordinal, statement in enumerate(statements):
+            self.ordinal = ordinal
+            self.compile_statement(statement)
+        self.emit(OpCode.NIL)
+        self.emit(OpCode.RETURN)
+        return self.function.code.finish()
+
+
+    # HELPER FUNCTIONS
+
+    def compile_statement(self, statement : stmt.Stmt) -> None:
+        enclosing_statement = self.current_statement
+        self.current_statement = statement
+        code = self.function.code
+        code.statements.append(statement)
+        code.ordinals.append(self.ordinal)
+        try:
+            statement.accept(self)
+        finally:
+            self.current_statement = enclosing_statement
+            code.statements.append(enclosing_statement)
+            code.ordinals.append(self.ordinal)
+
+
+    def compile_expression(self, expression : expr.Expr) -> None:
+        expression.accept(self)
+
+
+    def emit(self, opcode : OpCode, operand : int = 0) -> int:
+        """append an instruction, returning its offset"""
+        code = self.function.code
+        code.code.append(opcode)
+        code.code.append(operand)
+        code.lines.append(len(code.statements) - 1)
+        return len(code.code) - 2
+
+
+    def emit_constant(self, value : Any) -> None:
+        constants = self.function.code.constants
+        for i, constant in enumerate(constants):
+            if type(constant) is type(value) and constant == value:
+                break
+        else:
+            i = len(constants)
+            constants.append(value)
+        self.emit(OpCode.CONSTANT, i)
+
+
+    def patch(self, offset : int) -> None:
+        """point the jump at `offset` to the next instruction"""
+        self.function.code.code[offset + 1] = len(self.function.code.code)
+
+
+    def begin_scope(self) -> None:
+        self.function.scope_depth += 1
+
+
+    def end_scope(self) -> None:
+        function = self.function
+        function.scope_depth -= 1
+        while function.locals and function.locals[-1].depth > function.scope_depth:
+            self.emit(OpCode.CLOSE_UPVALUE if function.locals.pop().captured else OpCode.POP)
+
+
+    def declare_local(self, name : str, hoisted : bool = False) -> int:
+        self.function.locals.append(Local(name, self.function.scope_depth, hoisted))
+        return len(self.function.locals) - 1
+
+
+    def resolve_local(self, function : FunctionState, name : str) -> Optional[int]:
+        for slot in range(len(function.locals) - 1, 0, -1):
+            if function.locals[slot].name == name:
+                return slot
+        return None
+
+
+    def resolve_upvalue(self, function : FunctionState, name : str) -> Optional[int]:
+        if function.enclosing is None:
+            return None
+        local = self.resolve_local(function.enclosing, name)
+        if local is not None:
+            function.enclosing.locals[local].captured = True
+            return self.add_upvalue(function, True, local)
+        upvalue = self.resolve_upvalue(function.enclosing, name)
+        if upvalue is not None:
+            return self.add_upvalue(function, False, upvalue)
+        return None
+
+
+    def add_upvalue(self, function : FunctionState, is_local : bool, index : int) -> int:
+        if (is_local, index) in function.upvalues:
+            return function.upvalues.index((is_local, index))
+        function.upvalues.append((is_local, index))
+        function.code.upvalue_count = len(function.upvalues)
+        return len(function.upvalues) - 1
+
+
+    def scope_local(self, name : str) -> Optional[int]:
+        """the slot of `name` if it is a local of the current scope"""
+        for slot in range(len(self.function.locals) - 1, 0, -1):
+            if self.function.locals[slot].depth < self.function.scope_depth:
+                break
+            if self.function.locals[slot].name == name:
+                return slot
+        return None
+
+
+    def declare_variable(self, name : str) -> None:
+        """bind the value on top of the stack to `name` in the current scope"""
+        if self.function.scope_depth == 0 and self.function.enclosing is None:
+            self.emit(OpCode.DEFINE_GLOBAL, self.globals.declare(name))
+            return
+        if (slot := self.scope_local(name)) is not None: # redeclaration in the same scope reuses the slot
+            self.emit(OpCode.SET_LOCAL, slot)
+            self.emit(OpCode.POP)
+            return
+        self.declare_local(name)
+
+
+    def hoist(self, statements : List[stmt.Stmt]) -> None:
+        """declare the local functions of a block or function body on entry to it, like the Resolver does, so that
+        they can refer to functions declared after them. until its declaration runs, a hoisted function is UNDEFINED
+        and reading it is an error, as on the other engines"""
+        for statement in statements:
+            while isinstance(statement, stmt.Decorator):
+                statement = statement.function
+            if isinstance(statement, stmt.Function) and self.scope_local(statement.name.value) is None:
+                self.emit_constant(UNDEFINED)
+                self.declare_local(statement.name.value, True)
+
+
+    def hoisted(self, name : str) -> bool:
+        """whether `name`, read from the current function, is a local (or captured) function that was hoisted"""
+        function = self.function
+        while function is not None:
+            if (slot := self.resolve_local(function, name)) is not None:
+                return function.locals[slot].hoisted
+            function = function.enclosing
+        return False
+
+
+    def variable_access(self, name : str) -> tuple:
+        """(get opcode, set opcode, operand) for reading or writing `name` from the current function"""
+        if (slot := self.resolve_local(self.function, name)) is not None:
+            return OpCode.GET_LOCAL, OpCode.SET_LOCAL, slot
+        if (index := self.resolve_upvalue(self.function, name)) is not None:
+            return OpCode.GET_UPVALUE, OpCode.SET_UPVALUE, index
+        return OpCode.GET_GLOBAL, OpCode.SET_GLOBAL, self.globals.declare(name)
+
+
+    def compile_function(self, name : Optional[tokens.Token], parameters : List[expr.Variable], body) -> None:
+        """compile a function or lambda body into its own code object and emit the CLOSURE that creates it"""
+        function = FunctionState(Code(name, len(parameters)), self.function)
+        function.code.statements.append(self.current_statement)
+        function.code.ordinals.append(self.ordinal)
+        self.function = function
+        self.begin_scope()
+        for parameter in parameters:
+            self.declare_local(parameter.name.value)
+        if isinstance(body, expr.Call):
+            self.compile_tail_call(body)
+        elif isinstance(body, expr.Expr):
+            self.compile_expression(body)
+        else:
+            self.hoist(body)
+            for statement in body:
+                self.compile_statement(statement)
+            self.emit(OpCode.NIL)
+        self.emit(OpCode.RETURN)
+        self.function = function.enclosing
+
+        self.function.code.constants.append(function.code.finish())
+        self.emit(OpCode.CLOSURE, len(self.function.code.constants) - 1)
+        for is_local, index in function.upvalues:
+            self.emit(int(is_local), index)
+
+
+    # STATEMENTS
+
+    def visit_block_statement(self, s : stmt.Block) -> None:
+        self.begin_scope()
+        self.hoist(s.statements)
+        for statement in s.statements:
+            self.compile_statement(statement)
+        self.end_scope()
+
+
+    def visit_if_statement(self, s : stmt.If) -> None:
+        self.compile_expression(s.condition)
+        skip_then = self.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile_statement(s.statement)
+        if s.else_branch:
+            skip_else = self.emit(OpCode.JUMP)
+            self.patch(skip_then)
+            self.compile_statement(s.else_branch)
+            self.patch(skip_else)
+        else:
+            self.patch(skip_then)
+
+
+    def visit_while_statement(self, s : stmt.While) -> None:
+        loop_start = len(self.function.code.code)
+        self.compile_expression(s.condition)
+        exit_jump = self.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile_statement(s.statement)
+        self.emit(OpCode.JUMP, loop_start)
+        self.patch(exit_jump)
+
+
+    def visit_for_statement(self, s : stmt.For) -> None:
+        # the loop has a scope of its own (see Resolver.visit_for_statement), so that the variable declared in init is
+        # pushed once on entry and popped on exit however often the loop itself runs
+        self.begin_scope()
+        if isinstance(s.init, expr.Expr):
+            self.compile_expression(s.init)
+            self.emit(OpCode.POP)
+        else:
+            self.compile_statement(s.init)
+        loop_start = len(self.function.code.code)
+        exit_jump = None
+        if s.condition is not None:
+            self.compile_expression(s.condition)
+            exit_jump = self.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile_statement(s.statement)
+        if s.iter is not None:
+            self.compile_expression(s.iter)
+            self.emit(OpCode.POP)
+        self.emit(OpCode.JUMP, loop_start)
+        if exit_jump is not None:
+            self.patch(exit_jump)
+        self.end_scope()
+
+
+    def visit_foreach_statement(self, s : stmt.ForEach) -> None:
+        # the length of the list is taken once, the list itself is re-read on every iteration (like the Interpreter)
+        self.begin_scope()
+        self.compile_expression(s.listvar)
+        self.emit(OpCode.LEN)
+        count = self.declare_local(' count')
+        self.emit_constant(0.0)
+        index = self.declare_local(' index')
+
+        loop_start = len(self.function.code.code)
+        self.emit(OpCode.GET_LOCAL, index)
+        self.emit(OpCode.GET_LOCAL, count)
+        self.emit(OpCode.LESS)
+        exit_jump = self.emit(OpCode.POP_JUMP_IF_FALSE)
+
+        self.begin_scope()
+        self.compile_expression(s.listvar)
+        self.emit(OpCode.GET_LOCAL, index)
+        self.emit(OpCode.INDEX)
+        self.declare_local(s.itervar.name.value)
+        self.compile_statement(s.statement)
+        self.end_scope()
+
+        self.emit(OpCode.GET_LOCAL, index)
+        self.emit_constant(1.0)
+        self.emit(OpCode.ADD)
+        self.emit(OpCode.SET_LOCAL, index)
+        self.emit(OpCode.POP)
+        self.emit(OpCode.JUMP, loop_start)
+        self.patch(exit_jump)
+        self.end_scope()
+
+
+    def visit_expression_statement(self, s : stmt.Expression) -> None:
+        self.compile_expression(s.expression)
+        self.emit(OpCode.POP)
+
+
+    def visit_variable_statement(self, s : stmt.Var) -> None:
+        if s.initializer is not None:
+            self.compile_expression(s.initializer)
+        else:
+            self.emit(OpCode.NIL)
+        self.declare_variable(s.name.value)
+
+
+    def visit_blank_statement(self, s : stmt.Blank) -> None:
+        pass
+
+
+    def visit_function_statement(self, s : stmt.Function) -> None:
+        if self.function.scope_depth == 0 and self.function.enclosing is None:
+            self.compile_function(s.name, s.params, s.body)
+            self.declare_variable(s.name.value)
+        else:
+            # declare the local first (unless it was hoisted) so that the function can refer to itself
+            if (slot := self.scope_local(s.name.value)) is None:
+                self.emit(OpCode.NIL)
+                slot = self.declare_local(s.name.value)
+            self.compile_function(s.name, s.params, s.body)
+            self.emit(OpCode.SET_LOCAL, slot)
+            self.emit(OpCode.POP)
+
+
+    def visit_return_statement(self, s : stmt.Return) -> None:
+        if type(s.value) is expr.Call and self.function.enclosing is not None:
+            self.compile_tail_call(s.value)
+        elif s.value is not None:
+            self.compile_expression(s.value)
+        else:
+            self.emit(OpCode.NIL)
+        self.emit(OpCode.RETURN)
+
+
+    def compile_tail_call(self, e : expr.Call) -> None:
+        """a call whose value is returned right away. when the callee is not a VM closure, TAIL_CALL acts like CALL
+        and the RETURN that follows it returns the result"""
+        self.compile_expression(e.callee)
+        for argument in e.arguments:
+            self.compile_expression(argument)
+        self.emit(OpCode.TAIL_CALL, len(e.arguments))
+
+
+    def visit_decorator_statement(self, s : stmt.Decorator) -> None:
+        self.compile_statement(s.function)
+        declaration = s.function
+        while isinstance(declaration, stmt.Decorator):
+            declaration = declaration.function
+        get, set, operand = self.variable_access(declaration.name.value)
+        self.compile_expression(s.decorator)
+        self.emit(get, operand)
+        self.emit(OpCode.CALL, 1)
+        self.emit(set, operand)
+        self.emit(OpCode.POP)
+
+
+    # EXPRESSIONS
+
+    def visit_binary_expression(self, e : expr.Binary) -> None:
+        self.compile_expression(e.left)
+        self.compile_expression(e.right)
+        self.emit(BINARY_OPCODES[e.operator.type])
+
+
+    def visit_call_expression(self, e : expr.Call) -> None:
+        self.compile_expression(e.callee)
+        for argument in e.arguments:
+            self.compile_expression(argument)
+        self.emit(OpCode.CALL, len(e.arguments))
+
+
+    def visit_logical_expression(self, e : expr.Logical) -> None:
+        self.compile_expression(e.left)
+        if e.operator.type == tokens.TokenType.OR:
+            short_circuit = self.emit(OpCode.JUMP_IF_TRUE_OR_POP)
+        else:
+            short_circuit = self.emit(OpCode.JUMP_IF_FALSE_OR_POP)
+        self.compile_expression(e.right)
+        self.patch(short_circuit)
+
+
+    def visit_grouping_expression(self, e : expr.Grouping) -> None:
+        self.compile_expression(e.expression)
+
+
+    def visit_literal_expression(self, e : expr.Literal) -> None:
+        if e.value is None:
+            self.emit(OpCode.NIL)
+        else:
+            self.emit_constant(e.value)
+
+
+    def visit_unary_expression(self, e : expr.Unary) -> None:
+        self.compile_expression(e.right)
+        if e.operator.type == tokens.TokenType.BANG:
+            self.emit(OpCode.NOT)
+        elif e.operator.type == tokens.TokenType.MINUS:
+            self.emit(OpCode.NEGATE)
+        else:
+            self.emit(OpCode.POP)
+            self.emit(OpCode.NIL)
+
+
+    def visit_variable_exression(self, e : expr.Variable) -> None:
+        get, _, operand = self.variable_access(e.name.value)
+        self.emit(get, operand)
+        if get != OpCode.GET_GLOBAL and self.hoisted(e.name.value):
+            self.emit(OpCode.CHECK_DEFINED)
+
+
+    def visit_assignment_expression(self, e : expr.Assignment) -> None:
+        get, set, operand = self.variable_access(e.name.name.value)
+        # check that the variable exists before evaluating the right hand side, like the Interpreter
+        if set == OpCode.SET_GLOBAL:
+            self.emit(OpCode.GET_GLOBAL, operand)
+            self.emit(OpCode.POP)
+        elif self.hoisted(e.name.name.value):
+            self.emit(get, operand)
+            self.emit(OpCode.CHECK_DEFINED)
+            self.emit(OpCode.POP)
+        self.compile_expression(e.expression)
+        self.emit(set, operand)
+
+
+    def visit_index_expression(self, e : expr.Index) -> None:
+        self.compile_expression(e.list)
+        self.compile_expression(e.index)
+        self.emit(OpCode.INDEX)
+
+
+    def visit_slice_expression(self, e : expr.Slice) -> None:
+        self.compile_expression(e.list)
+        self.compile_expression(e.start)
+        self.compile_expression(e.stop)
+        self.compile_expression(e.step)
+        self.emit(OpCode.SLICE)
+
+
+    def visit_list_expression(self, e : expr.ListExpr) -> None:
+        for element in e.value:
+            self.compile_expression(element)
+        self.emit(OpCode.BUILD_LIST, len(e.value))
+
+
+    def visit_lambda_expression(self, e : expr.Lambda) -> None:
+        self.compile_function(None, e.parameters, e.expression)
+
+
+    def visit_ternary_expression(self, e : expr.Ternary) -> None:
+        self.compile_expression(e.condition)
+        skip_true = self.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile_expression(e.if_condition)
+        skip_false = self.emit(OpCode.JUMP)
+        self.patch(skip_true)
+        self.compile_expression(e.else_condition)
+        self.patch(skip_false)
+
+
+
+def disassemble(code : Code, globals = None, title : str = '<script>') -> str:
+    """human readable listing of a code object and, recursively, of the functions it creates"""
+
+    global_names : Dict[int, str] = {slot : name for name, slot in globals.slots.items()} if globals else {}
+    lines = [f"== {code.name.value if code.name else title} =="]
+    nested : List[Code] = []
+
+    offset = 0
+    while offset < len(code.code):
+        opcode, operand = OpCode(code.code[offset]), code.code[offset + 1]
+        line = f"{offset:04d}  {opcode.name:<22}"
+        if opcode in (OpCode.CONSTANT, OpCode.CLOSURE):
+            line += f"{operand:>4}  ({code.constants[operand]!r})"
+        elif opcode in (OpCode.GET_GLOBAL, OpCode.SET_GLOBAL, OpCode.DEFINE_GLOBAL):
+            line += f"{operand:>4}  ({global_names.get(operand, '?')})"
+        elif opcode in (OpCode.JUMP, OpCode.POP_JUMP_IF_FALSE, OpCode.JUMP_IF_FALSE_OR_POP, OpCode.JUMP_IF_TRUE_OR_POP):
+            line += f"{operand:>4}  (-> {operand:04d})"
+        elif opcode in (OpCode.GET_LOCAL, OpCode.SET_LOCAL, OpCode.GET_UPVALUE, OpCode.SET_UPVALUE, OpCode.CALL, OpCode.TAIL_CALL, OpCode.BUILD_LIST):
+            line += f"{operand:>4}"
+        lines.append(line.rstrip())
+        offset += 2
+
+        if opcode == OpCode.CLOSURE:
+            function = code.constants[operand]
+            nested.append(function)
+            for _ in range(function.upvalue_count):
+                is_local, index = code.code[offset], code.code[offset + 1]
+                lines.append(f"{offset:04d}      | {'local' if is_local else 'upvalue'} {index}")
+                offset += 2
+
+    for function in nested:
+        lines.append("")
+        lines.append(disassemble(function, globals, '<lambda>'))
+    return "\n".join(lines)
+
+
+
+if __name__ == '__main__':
+    # python -m lox.pipeline.compiler script.lox : print the bytecode of a script
+    from lox import state
+    from lox.pipeline import lexer, parser, resolver, interpreter
+
+    interpreter_lox = interpreter.Interpreter()
+    with state.use(interpreter_lox.state) as current:
+        current.current_file_name = sys.argv[1]
+        current.currently_executing_program = open(sys.argv[1]).read()
+        program = parser.Parser(lexer.Lexer(current.currently_executing_program).stream()).parse()
+        if program and resolver.Resolver(interpreter_lox).resolve(program):
+            print(disassemble(Compiler(interpreter_lox).compile(program), interpreter_lox.globals))
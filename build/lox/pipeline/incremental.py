@@ -0,0 +1,182 @@
+"""
+incremental parsing, for editor tooling: a Document keeps a Lox source parsed as it is edited
+
+The source is split into chunks, one per top level declaration: a chunk runs from the first token of its declaration
+up to the first token of the next one (the first chunk starts at 0), and holds the declaration's statement (None if it
+didn't parse at all) along with the errors reported while lexing and parsing it. Neither the Lexer nor the recovering
+Parser carries anything over from one top level declaration to the next, so an edit only needs the chunks it touches
+re-lexed and re-parsed: every other chunk keeps its statement. The reparsed region is widened when that's not enough:
+    - to the previous chunk, if its declaration looked at the first token of the region (eg. `if` looking for `else`)
+    - back to the first chunk that leaves a string or comment open, since any later text can close it (a `//` is
+      open until a newline ends it: before that it lexes as two '/')
+    - to the next chunks, for as long as the last declaration of the region runs off its end (eg. a '{' left open),
+      the region leaves a string or comment open, or the next chunk starts on the edited line (its columns moved)
+so the statements of a Document are always those a full parse of its source would produce. Chunks after an edit only
+move: their line numbers are brought up to date when their statements (or errors) are next asked for. Every chunk keeps
+the nodes and tokens of its statement in flat lists, collected when it is parsed, so moving a chunk doesn't walk its
+tree. Asking for just the errors stays cheapest.
+"""
+
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+from lox import state, tokens, errors
+from lox import expr, stmt
+from lox.pipeline import lexer, parser
+
+
+
+class Chunk:
+
+    __slots__ = ('statement', 'errors', 'row', 'errors_row', 'lookahead', 'open', 'positioned')
+
+    def __init__(self, statement : Optional[stmt.Stmt], errors : list, row : int, lookahead : bool):
+        self.statement = statement
+        self.errors = errors
+        self.row : int = row # the row the chunk started at when the positions in statement were last updated
+        self.errors_row : int = row # and when the lines of its errors were
+        self.lookahead : bool = lookahead # whether parsing the declaration looked at the next chunk's first token
+        self.open : bool = False # whether it leaves a string or comment open, so that its lexing depends on later text
+        self.positioned : Tuple[list, list] = ([], []) # the nodes (that have a line) and tokens of statement
+        collect(statement, *self.positioned)
+
+    def shift(self, lines : int) -> None:
+        """move every position in statement `lines` lines down"""
+        nodes, tokens_ = self.positioned
+        for node in nodes:
+            node.line += lines
+        for token in tokens_:
+            token.row += lines
+
+
+
+def collect(node, nodes : list, tokens_ : list) -> None:
+    """add every node (that has a line) and token of a parsed subtree to nodes and tokens_"""
+    if isinstance(node, list):
+        for item in node:
+            collect(item, nodes, tokens_)
+    elif isinstance(node, tokens.Token):
+        tokens_.append(node)
+    elif isinstance(node, (expr.Expr, stmt.Stmt)):
+        if node.line is not None:
+            nodes.append(node)
+        for value in vars(node).values():
+            collect(value, nodes, tokens_)
+
+
+
+class Document:
+    """a Lox source, lexed and parsed with error recovery, that only reparses what each edit changed"""
+
+    def __init__(self, source : str = '', file : str = '<document>') -> None:
+        self.source : str = source
+        self.state = state.State(file)
+        self.state.echo = False # errors are for the editor to show, see errors()
+        self.chunks : List[Chunk] = []
+        self.starts : List[int] = [] # offset of every chunk in source
+        self.rows : List[int] = [] # (0-based) row of every chunk's start
+        self.reparsed : int = 0 # how many declarations the last edit parsed
+        self.reparse(0, 0)
+
+
+    def edit(self, start : int, end : int, text : str) -> None:
+        """replace source[start:end] with text, reparsing the declarations that changes"""
+        old = self.source
+        self.source = old[:start] + text + old[end:]
+        if not self.chunks:
+            return self.reparse(0, 0)
+
+        first = bisect_right(self.starts, start) - 1
+        if first > 0 and self.starts[first] == start: # the text may run on from the previous chunk's last token
+            first -= 1
+        while first > 0 and self.chunks[first-1].lookahead:
+            first -= 1
+        first = next((k for k, chunk in enumerate(self.chunks[:first]) if chunk.open), first)
+
+        stop = bisect_right(self.starts, end) # chunks[stop:] are past the edit: they just move
+        if (delta := len(text) - (end - start)):
+            self.starts[stop:] = [position + delta for position in self.starts[stop:]]
+        if (lines := text.count('\n') - old.count('\n', start, end)):
+            self.rows[stop:] = [row + lines for row in self.rows[stop:]]
+        while stop < len(self.chunks) and self.source.find('\n', start + len(text), self.starts[stop]) == -1:
+            stop += 1
+        self.reparse(first, stop)
+
+
+    def reparse(self, first : int, stop : int) -> None:
+        """re-lex and re-parse chunks[first:stop] (the whole source if there are no chunks yet), taking in more of the
+        following chunks, twice as many each time, for as long as the region's last declaration runs off its end"""
+        begin, row = (self.starts[first], self.rows[first]) if self.chunks else (0, 0)
+        more = 1
+        while True:
+            end = self.starts[stop] if stop < len(self.chunks) else len(self.source)
+            chunks, starts, rows, open_end = self.parse_region(begin, end, row)
+            if stop == len(self.chunks) or not (open_end or (first == 0 and not chunks)): # chunks[0] must start at 0
+                break
+            stop = min(stop + more, len(self.chunks))
+            more *= 2
+        self.chunks[first:stop] = chunks
+        self.starts[first:stop] = starts
+        self.rows[first:stop] = rows
+        self.reparsed = len(chunks)
+
+
+    def parse_region(self, begin : int, end : int, row : int) -> Tuple[List[Chunk], List[int], List[int], bool]:
+        """lex and parse source[begin:end], which starts at `row`, into chunks. returns the chunks, their starts and
+        rows, and whether the region is open at the end, ie. whether the source after it could change its parse"""
+        column = begin - self.source.rfind('\n', 0, begin) - 1
+        parser_lox = parser.Parser(lexer.Lexer(self.source, True, begin, end, row, column).stream(), recover = True)
+        chunks : List[Chunk] = []
+        starts : List[int] = []
+        rows : List[int] = []
+
+        with state.use(self.state):
+            while True:
+                at_end = parser_lox.end()
+                if chunks and self.state.errors: # invalid characters after the previous declaration are part of its chunk
+                    chunks[-1].errors += self.state.errors
+                    self.state.errors = []
+                if at_end:
+                    break 
+                token = parser_lox.peek()
+                statement = parser_lox.parse_declaration_recovering()
+                lookahead = parser_lox.exhausted or parser_lox.MAX_POSITION >= parser_lox.position
+                starts.append(token.position if starts else begin)
+                rows.append(token.row if rows else row)
+                chunks.append(Chunk(statement, self.state.errors, rows[-1], lookahead))
+                self.state.errors = []
+
+        if self.state.errors: # nothing but invalid characters
+            starts.append(begin)
+            rows.append(row)
+            chunks.append(Chunk(None, self.state.errors, row, False))
+            self.state.errors = []
+
+        for chunk, chunk_start, chunk_end in zip(chunks, starts, starts[1:] + [end]):
+            comment = self.source.rfind('/*', chunk_start, chunk_end)
+            line_comment = self.source.rfind('//', chunk_start, chunk_end) # only a comment once a newline ends it
+            chunk.open = ((comment != -1 and self.source.find('*/', comment + 2, chunk_end) == -1)
+                          or (line_comment != -1 and self.source.find('\n', line_comment + 2, chunk_end) == -1)
+                          or any(error.message == lexer.UNTERMINATED_STRING for error in chunk.errors))
+        open_end = bool(chunks) and (chunks[-1].lookahead or any(chunk.open for chunk in chunks))
+        return chunks, starts, rows, open_end
+
+
+    def statements(self) -> List[stmt.Stmt]:
+        """the program: every top level declaration that parsed, as a full parse of source would give them"""
+        for chunk, row in zip(self.chunks, self.rows):
+            if chunk.row != row:
+                chunk.shift(row - chunk.row)
+                chunk.row = row
+        return [chunk.statement for chunk in self.chunks if chunk.statement is not None]
+
+
+    def errors(self) -> List[errors.LoxError]:
+        """every lex and parse error in source, in order"""
+        for chunk, row in zip(self.chunks, self.rows):
+            if chunk.errors_row != row:
+                for error in chunk.errors:
+                    if error.line is not None:
+                        error.line += row - chunk.errors_row
+                chunk.errors_row = row
+        return [error for chunk in self.chunks for error in chunk.errors]
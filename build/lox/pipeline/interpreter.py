@@ -1,4 +1,5 @@
-from typing import Any, List, Union 
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Union 
 import sys 
 
 from lox import tokens 
@@ -6,61 +7,105 @@ from lox import state
 from lox import expr 
 from lox import stmt 
 from lox import utils
+from lox import errors
 from lox import environment
-from lox.loxcallable import Clock, Scan, Print, Len, LoxFunction, LoxLambda, Return_Exception, Printf 
+from lox.loxcallable import Clock, Scan, Print, Len, LoxFunction, LoxLambda, TailCall, Printf 
+from lox.loxcallable import Map, Filter, Reduce, ListInsert, Append, Range, Sum, Sort 
 
 
 
+MAX_CALL_DEPTH = 5000 # nested (non-tail) Lox calls allowed before reporting a stack overflow
+CALL_DEPTH_LIMIT = 1000000 # the largest max_depth
+PYTHON_RECURSION_LIMIT = 20000 # python's recursion limit while Lox runs, see python_recursion_limit
+# the largest max_depth each engine can honour (run.execute lowers max_depth to it). only the VM keeps Lox frames off
+# the python stack: the tree-walker and the closure engine nest python calls for every Lox call, and these are about
+# as deep as a simple recursive function gets before PYTHON_RECURSION_LIMIT. function bodies nesting deeper statements
+# or expressions reach python's limit after fewer calls, which is reported as a stack overflow all the same
+CALL_DEPTH_LIMITS = {'tree' : 1200, 'closure' : 3500, 'vm' : CALL_DEPTH_LIMIT}
 
 
 
+@contextmanager
+def python_recursion_limit() -> Iterator[None]:
+    """raise python's recursion limit to PYTHON_RECURSION_LIMIT for the duration of the with block (run.run runs
+    programs in one). python's default of 1000 would stop the tree-walker at a few dozen nested Lox calls. it can't be
+    raised much further than this though: recursion through C code (natives calling back into Lox, pickling or
+    comparing deeply nested values) would overflow the C stack and crash instead of raising a RecursionError"""
+    previous = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(previous, PYTHON_RECURSION_LIMIT))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(previous)
+
+
 
 class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
+    """
+    Tree-walking engine. Statements complete with None, a 1-tuple holding the value of a `return` that unwinds to
+    the enclosing function, or a TailCall for a `return f(...)`, which call_function makes in a loop instead of
+    nesting. Every engine counts nested Lox calls in `depth` and reports a stack overflow past `max_depth`, or when
+    python's own recursion limit is reached first (see CALL_DEPTH_LIMITS)
+    """
 
-    def __init__(self):
-        self.globals = environment.Environment(self)
+    def __init__(self, max_depth : int = MAX_CALL_DEPTH):
+        self.state = state.State() # made the current state by run.run while this interpreter runs
+        self.globals = environment.GlobalEnvironment()
         self.environment = self.globals
         self.last_line = 1
-        self.foreach_count = 0
         self.last_executed_statement = None 
+        self.depth : int = 0
+        self.max_depth : int = min(max_depth, CALL_DEPTH_LIMIT)
         self.globals.define('clock', Clock())
         self.globals.define('scan', Scan())
         self.globals.define('print', Print())
         self.globals.define('len', Len())
         self.globals.define('printf', Printf())
-
-    def interpret(self, statements : Union[List[stmt.Stmt],stmt.Stmt]) -> None:
+        self.globals.define('map', Map())
+        self.globals.define('filter', Filter())
+        self.globals.define('reduce', Reduce())
+        self.globals.define('list_insert', ListInsert())
+        self.globals.define('append', Append())
+        self.globals.define('range', Range())
+        self.globals.define('sum', Sum())
+        self.globals.define('sort', Sort())
+
+    def interpret(self, statements : Union[List[stmt.Stmt],stmt.Stmt]):
         if type(statements) == list:
             for i in statements:
-                self.last_executed_statement = i
-                i.accept(self)
+                if self.interpret(i) is not None: # a top level return ends the program
+                    break
                 self.last_line += 1
         else: 
             self.last_executed_statement = statements
-            statements.accept(self)
+            return statements.accept(self)
 
-    def execute(self, statement : stmt.Stmt) -> None:
-        statement.accept(self) 
+    def execute(self, statement : stmt.Stmt):
+        return statement.accept(self) 
 
 
-    def execute_block(self, statements : List[stmt.Stmt], envy : environment.Environment) -> None:
+    def execute_block(self, statements : List[stmt.Stmt], envy : environment.Environment):
         previous : environment.Environment = self.environment
         try:
             self.environment = envy
             for i in statements: 
-                self.interpret(i) 
+                completion = self.interpret(i) 
+                if completion is not None:
+                    return completion
         finally:
             self.environment = previous
 
 
-    def evaluate_block(self, expression : expr.Expr, envy : environment.Environment):
+    def evaluate_tail(self, expression : expr.Expr, envy : environment.Environment):
+        """evaluate the body of a lambda in `envy`, as if it were `return expression;`"""
         previous : environment.Environment = self.environment
         try:
             self.environment = envy
-            a = self.evaluate(expression)
+            if type(expression) is expr.Call:
+                return self.tail_call(expression)
+            return (self.evaluate(expression),)
         finally:
             self.environment = previous
-            return a 
         
 
     def evaluate(self, expression : expr.Expr): 
@@ -68,11 +113,13 @@ class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
     
     
     def report(self, message : str) -> None:
-        print(f"\nfile {state.current_file_name}, line {self.last_line}")
-        print(f"{self.last_executed_statement}")
-        print(f"RuntimeError: {message}") 
-        state.error_flag = True 
-        sys.exit()
+        line = self.last_executed_statement.line if self.last_executed_statement and self.last_executed_statement.line else self.last_line
+        if self.state.echo:
+            print(f"\nfile {self.state.current_file_name}, line {line}")
+            print(f"{self.last_executed_statement}")
+            print(f"RuntimeError: {message}") 
+        column = self.last_executed_statement.column if self.last_executed_statement else None
+        raise errors.record("RuntimeError", message, self.state.current_file_name, line, column)
 
     def visit_binary_expression(self, e : expr.Binary) -> str: 
         left = self.evaluate(e.left)
@@ -118,14 +165,30 @@ class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
             return None 
     
 
+    def frame(self, variable : expr.Variable) -> environment.Environment:
+        """the environment holding a resolved variable"""
+        if variable.depth is None:
+            return self.globals
+        envy = self.environment
+        for _ in range(variable.depth):
+            envy = envy.enclosing
+        return envy
+
+
     def visit_variable_exression(self, e : expr.Variable):
-        return self.environment.get(e.name.value)
+        value = self.frame(e).values[e.slot]
+        if value is environment.UNDEFINED:
+            self.report("Variables must be declared before use!")
+        return value 
     
 
     def visit_assignment_expression(self, e : expr.Assignment):
-        self.environment.get(e.name.name.value)
+        envy = self.frame(e.name)
+        if envy.values[e.name.slot] is environment.UNDEFINED:
+            self.report("Variables must be declared before use!")
         rhs = self.evaluate(e.expression)
-        return self.environment.set(e.name.name.value, rhs)
+        envy.values[e.name.slot] = rhs 
+        return rhs 
 
 
     def visit_call_expression(self, e : expr.Call):
@@ -133,13 +196,47 @@ class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
         arguments = []
         for i in e.arguments:
             arguments.append(self.evaluate(i))
+        return self.call(callee, arguments)
+
 
+    def call(self, callee, arguments : List):
+        self.check_call(callee, arguments)
+        return callee.call(self, arguments)
+
+
+    def check_call(self, callee, arguments : List) -> None:
         if not hasattr(callee, "call"):
             self.report("can't call a non-callable object")
 
         if not (isinstance(callee, Print) or isinstance(callee, Printf)) and len(arguments) != callee.arity():
             self.report(f"The function expected {callee.arity()} arguments but received {len(arguments)} arguments")
-        return callee.call(self, arguments)
+
+
+    def call_function(self, function : Union[LoxFunction, LoxLambda], arguments : List):
+        """run a user-defined function, then whatever it tail calls, on one level of the Lox call stack"""
+        if self.depth >= self.max_depth:
+            self.report("stack overflow")
+        self.depth += 1
+        try:
+            while True:
+                completion = function.execute(self, arguments)
+                if type(completion) is not TailCall:
+                    return completion[0] if completion is not None else None
+                function, arguments = completion.function, completion.arguments
+        finally:
+            self.depth -= 1
+
+
+    def tail_call(self, e : expr.Call):
+        """complete a function with the call `e`: user-defined callees become a TailCall, natives are called now"""
+        callee = self.evaluate(e.callee)
+        arguments = []
+        for i in e.arguments:
+            arguments.append(self.evaluate(i))
+        if type(callee) is LoxFunction or type(callee) is LoxLambda:
+            self.check_call(callee, arguments)
+            return TailCall(callee, arguments)
+        return (self.call(callee, arguments),)
     
     def visit_index_expression(self, e : expr.Index):
         callee = self.evaluate(e.list)
@@ -157,56 +254,56 @@ class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
         step = self.evaluate(e.step)
 
         try:
-            new = expr.ListExpr(callee[int(start) : int(stop) : int(step)])
-            return self.evaluate(new)
-            print(new, new.value)
-            return self.evaluate(new)
+            return list(callee[int(start) : int(stop) : int(step)])
         except:
             self.report("can't slice dat")
 
     def visit_block_statement(self, s : stmt.Block):
-        self.execute_block(s.statements, environment.Environment(self, self.environment))
+        return self.execute_block(s.statements, environment.Environment(self.environment, s.size))
 
 
     def visit_if_statement(self, s : stmt.If):
         if self.evaluate(s.condition): 
-            self.interpret(s.statement)
+            return self.interpret(s.statement)
         else:
             if s.else_branch: 
-                self.interpret(s.else_branch)
+                return self.interpret(s.else_branch)
 
 
     def visit_while_statement(self, s : stmt.While):
         while self.evaluate(s.condition):
-            self.interpret(s.statement)
+            completion = self.interpret(s.statement)
+            if completion is not None:
+                return completion
 
 
 
     def visit_for_statement(self, s : stmt.For):
-        if isinstance(s.init, expr.Expr):
-            s.init = stmt.Expression(s.init)
-        self.interpret(s.init)
-        if iter != None: 
-            new_block_statements = stmt.Block([s.statement, stmt.Expression(s.iter)]) 
-        else: 
-            new_block_statements = s.statement
-        if not isinstance(s.condition, stmt.Blank):
-            desugar = stmt.While(s.condition, new_block_statements)
-        else: 
-            desugar = stmt.While(True, new_block_statements)
-        self.interpret(desugar)
+        previous : environment.Environment = self.environment
+        try:
+            self.environment = environment.Environment(previous, s.size)
+            if isinstance(s.init, expr.Expr):
+                self.evaluate(s.init)
+            else:
+                self.interpret(s.init)
+            while s.condition is None or self.evaluate(s.condition):
+                completion = self.interpret(s.statement)
+                if completion is not None:
+                    return completion
+                if s.iter is not None:
+                    self.evaluate(s.iter)
+        finally:
+            self.environment = previous
 
 
     def visit_foreach_statement(self, s : stmt.ForEach):
-        varname = tokens.Token(tokens.TokenType.IDENTIFIER, '__RESERVED_FOR_EACH__VAR__'+str(self.foreach_count), 0,0,0)
-        self.foreach_count += 1 
-        init = stmt.Var(varname, expr.Literal(0))
-        condition = expr.Binary(expr.Variable(varname), tokens.Token(tokens.TokenType.LESSER,'',0,0,0), expr.Literal(len(self.evaluate(s.listvar))))
-        iter = stmt.Expression(expr.Assignment(expr.Variable(varname), expr.Binary(expr.Variable(varname), tokens.Token(tokens.TokenType.PLUS,'',0,0,0), expr.Literal(1))))
-        new_block_statement = stmt.Block([stmt.Var(s.itervar.name, expr.Index(s.listvar, expr.Variable(varname))), s.statement])
-        desugar = stmt.For(init, condition, iter, new_block_statement)
-        self.interpret(desugar)
-        self.foreach_count -= 1 
+        iterable = self.evaluate(s.listvar)
+        for i in range(len(iterable)):
+            envy = environment.Environment(self.environment, s.size)
+            envy.values[s.itervar.slot] = self.evaluate(s.listvar)[i]
+            completion = self.execute_block([s.statement], envy)
+            if completion is not None:
+                return completion
         
 
     def visit_expression_statement(self, s : stmt.Expression):
@@ -216,10 +313,11 @@ class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
     def visit_variable_statement(self, s : stmt.Var):
         try:
             initial_value = self.evaluate(s.initializer)
+        except RecursionError: # reported as a stack overflow by run.execute
+            raise 
         except:
             initial_value = None
-        finally:
-            self.environment.define(s.name.value, initial_value)
+        self.environment.values[s.slot] = initial_value
     
 
     def visit_blank_statement(self, s):
@@ -229,32 +327,38 @@ class Interpreter(expr.Visitor[Any], stmt.Visitor[Any]):
     def visit_function_statement(self, s : stmt.Function):
         
         func : LoxFunction = LoxFunction(s, self.environment)
-        self.environment.define(s.name.value, func)
+        self.environment.values[s.slot] = func
     
     def visit_return_statement(self, s : stmt.Return):
+        if type(s.value) is expr.Call and self.depth:
+            return self.tail_call(s.value)
         value = None 
         if s.value: 
             value = self.evaluate(s.value)
-        raise Return_Exception(value)
+        return (value,)
     
     def visit_list_expression(self, e : expr.ListExpr):
         new = []
         for i in e.value:
             try:
                 new.append(self.evaluate(i))
+            except RecursionError: # reported as a stack overflow by run.execute
+                raise 
             except:
                 new.append(i)
         return new 
     
     def visit_lambda_expression(self, e : expr.Lambda):
-        return LoxLambda(e)
+        return LoxLambda(e, self.environment)
     
 
     def visit_ternary_expression(self, e : expr.Ternary):
         return self.evaluate(e.if_condition) if self.evaluate(e.condition) else self.evaluate(e.else_condition)
     
     def visit_decorator_statement(self, s : stmt.Decorator):
-        fun = expr.Call(s.decorator, [s.function])
-        fun = stmt.Function(s.function.name, s.function.params,[stmt.Expression(expr.Call(fun, s.function.params))])
-        func : LoxFunction = LoxFunction(fun, self.environment)
-        self.environment.define(s.function.name.value, func)
+        decorator = self.evaluate(s.decorator)
+        self.interpret(s.function)
+        function = s.function
+        while isinstance(function, stmt.Decorator):
+            function = function.function
+        self.environment.values[function.slot] = self.call(decorator, [self.environment.values[function.slot]])
@@ -1,77 +1,144 @@
-from typing import List
-import re 
-import sys 
+from typing import Iterator, List, Optional
+import re
 
 from lox import tokens
 from lox import state
-from lox import utils 
+from lox import utils
+from lox import errors
 
 
 
+UNTERMINATED_STRING = "unterminated string literal" # a '"' with no closing '"' after it lexes as UNRECOGNIZABLE
 
-class Lexer: 
+# one alternation of every non-keyword token type, tried in TokenType order (re alternation is ordered, so the
+# first alternative that matches wins, exactly like trying each pattern in turn). keywords are lexed as
+# identifiers and retagged via tokens.KEYWORD_TOKENS
+MASTER_PATTERN = re.compile('|'.join(f'(?P<{tokentype.name}>{tokentype.value})' for tokentype in tokens.TokenType
+                                     if tokentype not in tokens.KEYWORD_TOKENS.values()))
+
+
+
+class Lexer:
     """
     Implementation of a lexer/scanner for plox
 
     Lexical Grammar:
     """
 
-    def __init__(self, string : str):
-        self.position : int = 0
-        self.row : int = 0 
-        self.column : int = 0
-        self.string : str = string  
-        self.MAX_POSITION : int = len(string)
-        self.lexed_tokens : List[tokens.Token] = [] 
-
-
-    def match_token(self):
-        for tokentype in tokens.TokenType:
-            pattern = re.compile(tokentype.value)
-            match = pattern.match(self.string, pos=self.position)
-            if match:
-                matched_object = match.group()
-                if tokentype == tokens.TokenType.IDENTIFIER:
-                    if matched_object in state.KEYWORDS:
-                        continue 
-                new_token = tokens.Token(tokentype, matched_object, self.position, self.row, self.column)
-                self.position += len(matched_object)
-                self.column += len(matched_object)
-                self.actions(new_token)
-                return new_token
+    def __init__(self, string : str, recover : bool = False, position : int = 0, end : Optional[int] = None, row : int = 0, column : int = 0):
+        """lex string[position:end], which starts at (row, column) of string. tokens keep their offsets into string.
+        with recover, invalid characters are reported and skipped instead of ending the token stream"""
+        self.position : int = position
+        self.row : int = row
+        self.column : int = column
+        self.string : str = string
+        self.MAX_POSITION : int = len(string) if end is None else end
+        self.recover : bool = recover
+        self.lexed_tokens : List[tokens.Token] = []
+
+
+    def match_token(self) -> tokens.Token:
+        match = MASTER_PATTERN.match(self.string, self.position, self.MAX_POSITION)
+        matched_object = match.group()
+        tokentype = tokens.TokenType[match.lastgroup]
+        if tokentype is tokens.TokenType.IDENTIFIER:
+            tokentype = tokens.KEYWORD_TOKENS.get(matched_object, tokentype)
+        new_token = tokens.Token(tokentype, matched_object, self.position, self.row, self.column)
+        self.position += len(matched_object)
+        self.column += len(matched_object)
+        self.actions(new_token)
+        return new_token
 
 
     def actions(self, token: tokens.Token) -> None:
+        if '\n' in token.value: # newlines are also matched by SPACE, comments and strings, not just NEWLINE
+            self.row += token.value.count('\n')
+            self.column = len(token.value) - token.value.rindex('\n') - 1
         match token.type:
-            case tokens.TokenType.NEWLINE:
-                self.row += 1 
-                self.column = 0
             case tokens.TokenType.STRING:
                 token.value = token.value[1:-1]
             case tokens.TokenType.NUMBER:
                 token.value = float(token.value)
             case tokens.TokenType.UNRECOGNIZABLE:
-                self.report(f"Invalid character : {token.value}")
-            case _: 
-                pass 
+                self.report(UNTERMINATED_STRING if token.value == '"' else f"Invalid character : {token.value}")
+            case _:
+                pass
+
+
+    def stream(self) -> Iterator[tokens.Token]:
+        """lazily yield the significant (non-ignored) tokens of the source, one at a time"""
 
+        return TokenStream(self)
 
-    def lex(self):
 
-        while self.position < self.MAX_POSITION:
-            new_token = self.match_token()
-            self.lexed_tokens.append(new_token)
+    def lex(self) -> List[tokens.Token]:
 
-        self.lexed_tokens = list(filter(lambda i : i.type not in tokens.IGNORED_TOKENS, self.lexed_tokens)) 
+        self.lexed_tokens = list(self.stream())
+
+        return self.lexed_tokens
 
-        return self.lexed_tokens 
-    
 
     def report(self, message : str) -> None:
-        
-        print(f"file {state.current_file_name}, line {self.row+1}, column {self.column}")
-        print(f"{utils.nth_line_of_string(state.currently_executing_program, self.row)}")
-        print(" " * (self.column-1) + "^")
-        print(f"LexError: {message}")
-        state.error_flag = True 
-        sys.exit()
+
+        current = state.current()
+        if current.echo:
+            print(f"file {current.current_file_name}, line {self.row+1}, column {self.column}")
+            print(f"{utils.nth_line_of_string(current.currently_executing_program, self.row)}")
+            print(" " * (self.column-1) + "^")
+            print(f"LexError: {message}")
+        error = errors.record("LexError", message, current.current_file_name, self.row+1, self.column)
+        if not self.recover:
+            raise error
+
+
+
+class TokenStream:
+    """
+    the significant tokens of a Lexer, lexed one at a time as they are asked for. an iterator rather than a generator
+    because a generator is finished for good by any exception raised in it: a parser that runs out of python stack
+    while asking for a token (see Parser.parse_declaration_recovering) can ask again once it has unwound
+    """
+
+    __slots__ = ('lexer',)
+
+    def __init__(self, lexer : Lexer) -> None:
+        self.lexer = lexer
+
+    def __iter__(self) -> 'TokenStream':
+        return self
+
+    def __next__(self) -> tokens.Token:
+        lexer = self.lexer
+        while lexer.position < lexer.MAX_POSITION:
+            position, row, column = lexer.position, lexer.row, lexer.column
+            try:
+                new_token = lexer.match_token()
+            except RecursionError: # lex the token again next time
+                lexer.position, lexer.row, lexer.column = position, row, column
+                raise 
+            if new_token.type not in tokens.IGNORED_TOKENS and new_token.type is not tokens.TokenType.UNRECOGNIZABLE:
+                return new_token
+        raise StopIteration
+
+
+
+class NaiveLexer(Lexer):
+    """
+    the original lexer engine: tries each TokenType pattern one after the other at every position.
+    kept as a reference implementation for benchmarking and cross-checking the combined-pattern lexer
+    """
+
+    def match_token(self) -> tokens.Token:
+        for tokentype in tokens.TokenType:
+            pattern = re.compile(tokentype.value)
+            match = pattern.match(self.string, pos=self.position, endpos=self.MAX_POSITION)
+            if match:
+                matched_object = match.group()
+                if tokentype == tokens.TokenType.IDENTIFIER:
+                    if matched_object in state.KEYWORDS:
+                        continue
+                new_token = tokens.Token(tokentype, matched_object, self.position, self.row, self.column)
+                self.position += len(matched_object)
+                self.column += len(matched_object)
+                self.actions(new_token)
+                return new_token
@@ -1,7 +1,6 @@
-from typing import List, Union 
-import sys  
+from typing import Iterable, Iterator, List, Optional, Union 
 
-from lox import state, tokens, utils 
+from lox import state, tokens, utils, errors 
 from lox import expr, stmt
 
 
@@ -26,20 +25,39 @@ class Parser:
     """
 
     # HELPER FUNCTIONS
-    def __init__(self, lexed_tokens : List[tokens.Token]) -> None:
-        """ initialize parser with a list of lexed tokens """
+    def __init__(self, lexed_tokens : Iterable[tokens.Token], recover : bool = False) -> None:
+        """ initialize parser with lexed tokens, either a list or a lazy token stream (see Lexer.stream). 
+        with recover, a declaration or statement that fails to parse is reported and skipped up to the next 
+        synchronization point (see synchronize), so parsing carries on and every error in the source gets reported """
         self.position : int = 0 
-        self.LEXED_TOKENS : List[tokens.Token] = lexed_tokens
-        self.MAX_POSITION : int = len(lexed_tokens) - 1
+        self.token_stream : Iterator[tokens.Token] = iter(lexed_tokens)
+        self.LEXED_TOKENS : List[tokens.Token] = []
+        self.MAX_POSITION : int = -1
+        self.recover : bool = recover 
+        self.exhausted : bool = False # whether the parser has looked past the last token
+        self.nesting : int = 0 # how many parse_declaration_recovering calls are running, one inside the other
+
+
+    def fill(self, position : int) -> bool:
+        """pull tokens from the stream until `position` is buffered. returns false if the stream runs out first"""
+        while position > self.MAX_POSITION:
+            next_token = next(self.token_stream, None)
+            if next_token is None:
+                self.exhausted = True 
+                return False 
+            self.LEXED_TOKENS.append(next_token)
+            self.MAX_POSITION += 1
+        return True 
 
 
     def end(self) -> bool: 
         """return true iff the parser has parsed all tokens"""
-        return self.position > self.MAX_POSITION
+        return not self.fill(self.position)
     
 
     def peek(self) -> tokens.Token: 
         """return current token"""
+        self.fill(self.position)
         return self.LEXED_TOKENS[self.position]
 
 
@@ -49,7 +67,8 @@ class Parser:
     
     
     def peek_next(self) -> tokens.Token:
-        """"""
+        """return the token after the current one"""
+        self.fill(self.position+1)
         return self.LEXED_TOKENS[self.position+1]
 
     def match(self, expected_token_types: Union[List[tokens.TokenType],tokens.TokenType]) -> bool: 
@@ -69,7 +88,7 @@ class Parser:
         if not utils.supports_in_operator(expected_token_types):
             expected_token_types = [expected_token_types] 
 
-        if not self.end() and self.peek_next().type in expected_token_types:
+        if self.fill(self.position+1) and self.peek_next().type in expected_token_types:
             return True 
         else:
             return False     
@@ -91,6 +110,13 @@ class Parser:
             self.report(self.peek() if not self.end() else self.peek_previous(), error_message)
 
 
+    def at(self, node, token : tokens.Token):
+        """tag a node with the position of its first token"""
+        node.line = token.row + 1
+        node.column = token.column
+        return node
+
+
 
     #MAIN FUNCTIONS:
 
@@ -98,34 +124,79 @@ class Parser:
         """program -> (declaration)* EOF; outermost parsing rule, a program consists of zero or more statements followed by EOF"""
         statements: List[stmt.Stmt] = []
         while not self.end():
-            statements.append(self.parse_declaration())
+            if (declaration := self.parse_declaration_recovering()) is not None:
+                statements.append(declaration)
         return statements
-    
+
+
+    def parse_declaration_recovering(self) -> Optional[stmt.Stmt]:
+        """parse_declaration, except that in recover mode a declaration that fails to parse is skipped, returning None.
+        so is one nested too deeply for python's stack, which is reported as a stack overflow"""
+        if not self.recover:
+            return self.parse_declaration()
+        start = self.position
+        self.nesting += 1
+        try:
+            return self.parse_declaration()
+        except errors.LoxError: # reported and recorded already
+            self.synchronize(start)
+            return None 
+        except RecursionError:
+            if self.nesting > 1: # unwind to the top level declaration first, there's no stack left to report it here
+                raise 
+            try:
+                self.report(self.peek() if not self.end() else self.peek_previous(), "stack overflow")
+            except errors.LoxError:
+                pass 
+            self.synchronize(start)
+            return None 
+        finally:
+            self.nesting -= 1
+
+
+    def synchronize(self, start : int) -> None:
+        """skip the rest of the declaration that began at token `start` and failed to parse: up to and including its
+        ';' or its closing '}', or up to the next token that begins a declaration or the '}' that closes the enclosing
+        block, ignoring any of those nested in a block. always skips at least one token"""
+        depth = 0
+        while not self.end():
+            token_type = self.peek().type
+            if depth == 0 and self.position > start and (token_type == tokens.TokenType.RIGHT_BRACE or token_type in tokens.SYNCHRONIZING_TOKENS):
+                return 
+            self.position += 1
+            if token_type == tokens.TokenType.LEFT_BRACE:
+                depth += 1
+            elif token_type == tokens.TokenType.RIGHT_BRACE:
+                depth = max(depth - 1, 0)
+                if depth == 0:
+                    return 
+            elif token_type == tokens.TokenType.SEMICOLON and depth == 0:
+                return 
+
 
     def parse_declaration(self) -> stmt.Stmt:
         """declaration → function_declaration | variable_declaration | statement ;"""
 
-        if self.consume(tokens.TokenType.VAR, "", True):
+        if (keyword := self.consume(tokens.TokenType.VAR, "", True)):
             name = self.consume(tokens.TokenType.IDENTIFIER, "Expected identifier after `var`!")
             if self.consume(tokens.TokenType.EQUAL, "", True): 
                 initializer = self.parse_expression()
                 self.consume(tokens.TokenType.SEMICOLON, "Missing semicolon")
-                return stmt.Var(name, initializer) 
+                return self.at(stmt.Var(name, initializer), keyword) 
             else:
                 self.consume(tokens.TokenType.SEMICOLON, "Missing semicolon")
-                return stmt.Var(name, None)
+                return self.at(stmt.Var(name, None), keyword)
         
-        elif self.match(tokens.TokenType.FUN):
-            if self.match_next(tokens.TokenType.IDENTIFIER):
-                self.consume(tokens.TokenType.FUN, "")
-                return self.parse_function()
-            else:
-                return self.parse_expression()
+        elif self.match(tokens.TokenType.FUN) and self.match_next(tokens.TokenType.IDENTIFIER):
+            self.consume(tokens.TokenType.FUN, "")
+            return self.parse_function()
         
-        elif self.consume(tokens.TokenType.AT, "", True):
+        elif (at := self.consume(tokens.TokenType.AT, "", True)):
             v = self.parse_expression()
+            if not (self.match(tokens.TokenType.AT) or (self.match(tokens.TokenType.FUN) and self.match_next(tokens.TokenType.IDENTIFIER))):
+                self.report(self.peek() if not self.end() else self.peek_previous(), "Expected function declaration after decorator!")
             f = self.parse_declaration()
-            return stmt.Decorator(v,f)
+            return self.at(stmt.Decorator(v,f), at)
 
         else: 
             return self.parse_statement()
@@ -148,13 +219,14 @@ class Parser:
         self.consume(tokens.TokenType.LEFT_BRACE, "Expected '{' after function ()!")
         block = self.spec_parse_block()
 
-        return stmt.Function(name, parameter_list, block)
+        return self.at(stmt.Function(name, parameter_list, block), name)
 
 
     def spec_parse_block(self) -> List[stmt.Stmt]: 
         statements: List[stmt.Stmt] = []
         while not self.end() and not self.peek().type == tokens.TokenType.RIGHT_BRACE:
-            statements.append(self.parse_declaration())
+            if (declaration := self.parse_declaration_recovering()) is not None:
+                statements.append(declaration)
         self.consume(tokens.TokenType.RIGHT_BRACE, "Expected }!") 
         return statements
 
@@ -163,7 +235,8 @@ class Parser:
         """statement -> if_statement | while_statement | for_statement | print_statement | scan_statement | block | blank | expression_statement;
         rule for parsing different kinds of statements 
         """
-        if self.consume(tokens.TokenType.IF, "", True):                        # if_statement -> if (condition) statement (else statement)? 
+        start = self.position
+        if (keyword := self.consume(tokens.TokenType.IF, "", True)):                        # if_statement -> if (condition) statement (else statement)? 
             self.consume(tokens.TokenType.LEFT_PAREN, "Expected '(' after `if`!")
             condition = self.parse_expression()
             self.consume(tokens.TokenType.RIGHT_PAREN, "Expected ')' after '('!")
@@ -172,58 +245,61 @@ class Parser:
                 else_statement = self.parse_statement()
             else:
                 else_statement = None 
-            return stmt.If(condition, if_statement, else_statement) 
+            return self.at(stmt.If(condition, if_statement, else_statement), keyword) 
         
-        elif self.consume(tokens.TokenType.WHILE, "", True):
+        elif (keyword := self.consume(tokens.TokenType.WHILE, "", True)):
             self.consume(tokens.TokenType.LEFT_PAREN, "Expected '(' after `while`!")
             condition = self.parse_expression()
             self.consume(tokens.TokenType.RIGHT_PAREN, "Expected ')'!")
             statement = self.parse_statement()
-            return stmt.While(condition, statement) 
+            return self.at(stmt.While(condition, statement), keyword) 
         
-        elif self.consume(tokens.TokenType.FOR, "", True):
+        elif (keyword := self.consume(tokens.TokenType.FOR, "", True)):
             if self.consume(tokens.TokenType.EACH, "", True):
                 if (type(v := self.parse_primary()) == expr.Variable):
                     self.consume(tokens.TokenType.IN, "Expected keyword 'in' after for each ...") 
                     if type(w := self.parse_primary()) == expr.Variable: 
                         statement = self.parse_statement()
-                        return stmt.ForEach(v,w,statement)
+                        return self.at(stmt.ForEach(v,w,statement), keyword)
                 else:
-                    self.report(self.peek(), 'ParseSky ERROR')
+                    self.report(self.peek() if not self.end() else self.peek_previous(), 'ParseSky ERROR')
 
             self.consume(tokens.TokenType.LEFT_PAREN, "Expected '(' after `for`!")
             if self.match(tokens.TokenType.VAR): 
                 init = self.parse_declaration() 
             else: 
                 init = self.parse_statement()
-            condition = self.parse_statement()
-            condition = None if isinstance(condition, stmt.Blank) else condition.expression
+            if self.consume(tokens.TokenType.SEMICOLON, "", True):
+                condition = None 
+            else:
+                condition = self.parse_expression()
+                self.consume(tokens.TokenType.SEMICOLON, "Missing semicolon")
             if not self.match(tokens.TokenType.RIGHT_PAREN):
                 iter = self.parse_expression()
             else: 
                 iter = None 
             self.consume(tokens.TokenType.RIGHT_PAREN, "Expected ')'!")
             statement = self.parse_statement()
-            return stmt.For(init, condition, iter, statement) 
+            return self.at(stmt.For(init, condition, iter, statement), keyword) 
         
                 
-        elif self.consume(tokens.TokenType.LEFT_BRACE, "", True):
-            return stmt.Block(self.spec_parse_block()) 
+        elif (brace := self.consume(tokens.TokenType.LEFT_BRACE, "", True)):
+            return self.at(stmt.Block(self.spec_parse_block()), brace) 
         
-        elif self.consume(tokens.TokenType.SEMICOLON, "", True):
-            return stmt.Blank() 
+        elif (semicolon := self.consume(tokens.TokenType.SEMICOLON, "", True)):
+            return self.at(stmt.Blank(), semicolon) 
         
-        elif self.consume(tokens.TokenType.RETURN, "", True):
+        elif (keyword := self.consume(tokens.TokenType.RETURN, "", True)):
             return_value : expr.Expr = None 
             if not self.match(tokens.TokenType.SEMICOLON):
                 return_value = self.parse_expression()
             self.consume(tokens.TokenType.SEMICOLON, "Expected semicolon after return statement")
-            return stmt.Return(return_value)
+            return self.at(stmt.Return(return_value), keyword)
         
         else: 
             new_statement = self.parse_expression()
             self.consume(tokens.TokenType.SEMICOLON, "Missing semicolon")
-            return stmt.Expression(new_statement) 
+            return self.at(stmt.Expression(new_statement), self.LEXED_TOKENS[start]) 
 
 
 
@@ -237,7 +313,7 @@ class Parser:
             if self.consume(tokens.TokenType.EQUAL, "", True):
                 value = self.parse_expression()
                 name = expr.Variable(identifier)
-                return expr.Assignment(name, value) 
+                return self.at(expr.Assignment(name, value), identifier) 
             else: 
                 self.position -= 1
                 return self.parse_anon_function()
@@ -247,7 +323,7 @@ class Parser:
 
     def parse_anon_function(self):
 
-        if not self.consume(tokens.TokenType.FUN, "", True):
+        if not (keyword := self.consume(tokens.TokenType.FUN, "", True)):
             #return self.parse_logic_or()
             return self.parse_ternary()
         
@@ -265,10 +341,11 @@ class Parser:
         self.consume(tokens.TokenType.EQUAL, "Expected '=' after anonymous function!")
         self.consume(tokens.TokenType.GREATER, "Expected '>' after anonymous function!")
         e = self.parse_expression()
-        return expr.Lambda(parameter_list, e)
+        return self.at(expr.Lambda(parameter_list, e), keyword)
     
 
     def parse_ternary(self):
+        start = self.position
         if_true = self.parse_logic_or() 
         if self.consume(tokens.TokenType.IF, "", True):
             condition = self.parse_expression()
@@ -276,56 +353,62 @@ class Parser:
                 if_not = self.parse_expression()
             else:
                 if_not = expr.Literal(None)
-            return expr.Ternary(condition, if_true, if_not)
+            return self.at(expr.Ternary(condition, if_true, if_not), self.LEXED_TOKENS[start])
         else:
             return if_true
 
 
     def parse_logic_or(self) -> expr.Expr:
+        start = self.position
         lhs = self.parse_logic_and() 
         while (operator := self.consume(tokens.TokenType.OR, "", True)):
             rhs = self.parse_logic_and()
-            lhs = expr.Logical(lhs, operator, rhs)
+            lhs = self.at(expr.Logical(lhs, operator, rhs), self.LEXED_TOKENS[start])
         return lhs
     
 
     def parse_logic_and(self) -> expr.Expr: 
+        start = self.position
         lhs = self.parse_equality() 
         while (operator := self.consume(tokens.TokenType.AND, "", True)):
             rhs = self.parse_equality()
-            lhs = expr.Logical(lhs, operator, rhs)
+            lhs = self.at(expr.Logical(lhs, operator, rhs), self.LEXED_TOKENS[start])
         return lhs
 
 
     def parse_equality(self) -> expr.Expr:
+        start = self.position
         lhs = self.parse_comparison() 
         while (operator := self.consume(tokens.EQUALITY_OPERATORS, "", True)):
             rhs = self.parse_comparison()
-            lhs = expr.Binary(lhs, operator, rhs)
+            lhs = self.at(expr.Binary(lhs, operator, rhs), self.LEXED_TOKENS[start])
         return lhs
 
 
     def parse_comparison(self) -> expr.Expr:
+        start = self.position
         lhs = self.parse_term() 
         while (operator := self.consume(tokens.COMPARISON_OPERATORS, "", True)):
             rhs = self.parse_term()
-            lhs = expr.Binary(lhs, operator, rhs)
+            lhs = self.at(expr.Binary(lhs, operator, rhs), self.LEXED_TOKENS[start])
         return lhs
 
 
     def parse_term(self) -> expr.Expr:
+        start = self.position
         lhs = self.parse_factor() 
         while (operator := self.consume((tokens.TokenType.MINUS, tokens.TokenType.PLUS), "", True)):
             rhs = self.parse_factor()
-            lhs = expr.Binary(lhs, operator, rhs)
+            lhs = self.at(expr.Binary(lhs, operator, rhs), self.LEXED_TOKENS[start])
         return lhs
 
 
     def parse_factor(self) -> expr.Expr:
+        start = self.position
         lhs = self.parse_unary() 
         while (operator := self.consume((tokens.TokenType.TIMES, tokens.TokenType.DIVIDED_BY), "", True)):
             rhs = self.parse_unary()
-            lhs = expr.Binary(lhs, operator, rhs)
+            lhs = self.at(expr.Binary(lhs, operator, rhs), self.LEXED_TOKENS[start])
         return lhs
 
 
@@ -333,7 +416,7 @@ class Parser:
         """unary -> !unary | -unary | @unary | call"""
 
         if (operator := self.consume(tokens.UNARY_OPERATORS, "", True)):
-            return expr.Unary(operator, self.parse_unary()) 
+            return self.at(expr.Unary(operator, self.parse_unary()), operator) 
         else: 
             return self.parse_call()
 
@@ -345,6 +428,7 @@ class Parser:
 
 
     def parse_call(self):
+        start = self.position
         callee = self.parse_primary()
         expression_list : List[expr.Expr] = []  
         while self.consume(tokens.TokenType.LEFT_PAREN, "", True):
@@ -362,7 +446,7 @@ class Parser:
                 return callee 
             array = callee 
             while self.consume(tokens.TokenType.LEFT_SQUARE, "", True):
-                start = self.parse_expression()
+                index = self.parse_expression()
 
                 if self.consume(tokens.TokenType.COLON, "", True):
                     stop = self.parse_expression()
@@ -370,43 +454,44 @@ class Parser:
                         step = self.parse_expression()
                     else:
                         step = expr.Literal(1.0) 
-                    array = expr.Slice(array, start, stop, step)
+                    array = self.at(expr.Slice(array, index, stop, step), self.LEXED_TOKENS[start])
                 else:
-                    array = expr.Index(array, start)
+                    array = self.at(expr.Index(array, index), self.LEXED_TOKENS[start])
                 
                 self.consume(tokens.TokenType.RIGHT_SQUARE, "Expected ']' after '['!")
             
             return array
 
         self.consume(tokens.TokenType.RIGHT_PAREN, "Expected matching ')'!")
-        return expr.Call(callee, expression_list)
+        return self.at(expr.Call(callee, expression_list), self.LEXED_TOKENS[start])
 
 
     def parse_primary(self):
         if (name := self.consume(tokens.TokenType.IDENTIFIER, "", True)):
-            return expr.Variable(name)
+            return self.at(expr.Variable(name), name)
         elif (literal := self.consume(tokens.LITERAL_OBJECTS, "", True)):
-            return expr.Literal(literal.value)
+            return self.at(expr.Literal(literal.value), literal)
         elif (literal := self.consume(tokens.LITERAL_CONSTANTS, "", True)):
-            return expr.Literal(tokens.LITERAL_CONSTANTS[literal.type])
+            return self.at(expr.Literal(tokens.LITERAL_CONSTANTS[literal.type]), literal)
         elif self.consume(tokens.TokenType.LEFT_PAREN, "", True):
             temp = self.parse_expression()
             self.consume(tokens.TokenType.RIGHT_PAREN, "Expected ')' following '('")
             return temp 
-        elif self.consume(tokens.TokenType.LEFT_SQUARE, "", True):
+        elif (bracket := self.consume(tokens.TokenType.LEFT_SQUARE, "", True)):
             new_list : List[expr.Expr] = []
             new_list.append(self.parse_expression())
             while self.consume(tokens.TokenType.COMMA, "", True):
                 new_list.append(self.parse_expression())
             self.consume(tokens.TokenType.RIGHT_SQUARE, "Expected ']' following '['")
-            return expr.ListExpr(new_list)
+            return self.at(expr.ListExpr(new_list), bracket)
         else: 
-            literal_list = [i.value for i in literal_list]
-            self.report(self.peek(), "expected expression!")
+            self.report(self.peek() if not self.end() else self.peek_previous(), "expected expression!")
 
 
     def parse(self) -> List[stmt.Stmt]:
-        """entry point for parsing"""
+        """entry point for parsing. in recover mode, returns every declaration that parsed, even if some didn't"""
+        if self.recover:
+            return self.parse_program()
         try: 
             return self.parse_program()
         except:
@@ -415,10 +500,11 @@ class Parser:
 
     def report(self, token_with_error : tokens.Token, message : str) -> None:
         
-        error_column = token_with_error.column + (len(token_with_error.value) if self.end() else 0)
-        print(f"file {state.current_file_name}, line {token_with_error.row+1}, column {error_column}")
-        print(f"{utils.nth_line_of_string(state.currently_executing_program, token_with_error.row)}")
-        print(" " * (error_column) + "^")
-        print(f"ParseError: {message}")
-        state.error_flag = True 
-        sys.exit()
+        error_column = token_with_error.column + (len(str(token_with_error.value)) if self.end() else 0)
+        current = state.current()
+        if current.echo:
+            print(f"file {current.current_file_name}, line {token_with_error.row+1}, column {error_column}")
+            print(f"{utils.nth_line_of_string(current.currently_executing_program, token_with_error.row)}")
+            print(" " * (error_column) + "^")
+            print(f"ParseError: {message}")
+        raise errors.record("ParseError", message, current.current_file_name, token_with_error.row+1, error_column)
@@ -0,0 +1,253 @@
+from typing import Dict, List, Union
+
+from lox import state, tokens, utils, errors
+from lox import expr, stmt
+
+
+
+class Resolver(expr.Visitor[None], stmt.Visitor[None]):
+    """
+    Static pass run between the Parser and the Interpreter.
+
+    Every expr.Variable (and so every expr.Assignment target) is annotated with a (depth, slot) pair: the number of
+    frames to walk up from the current environment, and the index of the variable inside that frame. References to
+    globals get depth None and a slot in the interpreter's GlobalEnvironment. Declarations (stmt.Var, stmt.Function,
+    parameters, for each variables) are annotated with their slot, and scope-creating nodes with their frame size.
+
+    Variables that are not declared anywhere are reported here, before the program starts running.
+
+    Scoping is static: a name refers to the declaration in scope where the name is written. The functions of a block
+    (or function body) are declared on entry to it, so local functions can call each other whatever their order, but
+    a `var` only shadows from its declaration on: a closure written before `var a` in the same block reads the outer
+    `a`, even when it is called after the local one has been defined. A `for` loop is a scope of its own: the variable
+    declared in its initializer is gone once the loop is.
+    """
+
+    def __init__(self, interpreter) -> None:
+        self.globals = interpreter.globals
+        self.scopes : List[Dict[str, int]] = []
+        self.global_references : List[expr.Variable] = []
+        self.had_error : bool = False
+
+
+    def resolve(self, statements : Union[List[stmt.Stmt], stmt.Stmt]) -> bool:
+        """entry point for resolving. returns false if any errors were reported"""
+        self.resolve_statements(statements)
+
+        for variable in self.global_references:
+            if variable.name.value in self.globals.slots:
+                variable.slot = self.globals.slots[variable.name.value]
+            else:
+                self.report(variable.name, "Variables must be declared before use!")
+
+        return not self.had_error
+
+
+    # HELPER FUNCTIONS
+
+    def resolve_statements(self, statements : Union[List[stmt.Stmt], stmt.Stmt]) -> None:
+        if type(statements) != list:
+            statements = [statements]
+        for statement in statements:
+            statement.accept(self)
+
+
+    def resolve_expression(self, expression : expr.Expr) -> None:
+        if isinstance(expression, expr.Expr):
+            expression.accept(self)
+
+
+    def begin_scope(self) -> None:
+        self.scopes.append({})
+
+
+    def end_scope(self) -> int:
+        """close the innermost scope, returning the number of slots its frame needs"""
+        return len(self.scopes.pop())
+
+
+    def declare(self, name : tokens.Token) -> int:
+        """give `name` a slot in the innermost scope (redeclarations reuse the existing slot)"""
+        if not self.scopes:
+            return self.globals.declare(name.value)
+        scope = self.scopes[-1]
+        if name.value not in scope:
+            scope[name.value] = len(scope)
+        return scope[name.value]
+
+
+    def hoist(self, statements : List[stmt.Stmt]) -> None:
+        """declare the functions of a block or function body in the innermost scope before resolving any of it, so
+        that they can refer to functions declared after them (eg. mutually recursive ones)"""
+        for statement in statements:
+            while isinstance(statement, stmt.Decorator):
+                statement = statement.function
+            if isinstance(statement, stmt.Function):
+                self.declare(statement.name)
+
+
+    def resolve_function(self, parameters : List[expr.Variable], body : Union[List[stmt.Stmt], expr.Expr]) -> int:
+        """resolve a function or lambda body in a new scope holding its parameters. returns the frame size"""
+        self.begin_scope()
+        for parameter in parameters:
+            parameter.depth = 0
+            parameter.slot = self.declare(parameter.name)
+        if isinstance(body, expr.Expr):
+            self.resolve_expression(body)
+        else:
+            self.hoist(body)
+            self.resolve_statements(body)
+        return self.end_scope()
+
+
+    def report(self, token_with_error : tokens.Token, message : str) -> None:
+
+        current = state.current()
+        if current.echo:
+            print(f"file {current.current_file_name}, line {token_with_error.row+1}, column {token_with_error.column}")
+            print(f"{utils.nth_line_of_string(current.currently_executing_program, token_with_error.row)}")
+            print(" " * (token_with_error.column) + "^")
+            print(f"ResolveError: {message}")
+        errors.record("ResolveError", message, current.current_file_name, token_with_error.row+1, token_with_error.column)
+        self.had_error = True
+
+
+    # STATEMENTS
+
+    def visit_block_statement(self, s : stmt.Block) -> None:
+        self.begin_scope()
+        self.hoist(s.statements)
+        self.resolve_statements(s.statements)
+        s.size = self.end_scope()
+
+
+    def visit_if_statement(self, s : stmt.If) -> None:
+        self.resolve_expression(s.condition)
+        self.resolve_statements(s.statement)
+        if s.else_branch:
+            self.resolve_statements(s.else_branch)
+
+
+    def visit_while_statement(self, s : stmt.While) -> None:
+        self.resolve_expression(s.condition)
+        self.resolve_statements(s.statement)
+
+
+    def visit_for_statement(self, s : stmt.For) -> None:
+        self.begin_scope()
+        if isinstance(s.init, expr.Expr):
+            self.resolve_expression(s.init)
+        else:
+            self.resolve_statements(s.init)
+        self.resolve_expression(s.condition)
+        self.resolve_expression(s.iter)
+        self.resolve_statements(s.statement)
+        s.size = self.end_scope()
+
+
+    def visit_foreach_statement(self, s : stmt.ForEach) -> None:
+        self.resolve_expression(s.listvar)
+        self.begin_scope()
+        s.itervar.depth = 0
+        s.itervar.slot = self.declare(s.itervar.name)
+        self.resolve_statements(s.statement)
+        s.size = self.end_scope()
+
+
+    def visit_expression_statement(self, s : stmt.Expression) -> None:
+        self.resolve_expression(s.expression)
+
+
+    def visit_variable_statement(self, s : stmt.Var) -> None:
+        self.resolve_expression(s.initializer)
+        s.slot = self.declare(s.name)
+
+
+    def visit_blank_statement(self, s : stmt.Blank) -> None:
+        pass
+
+
+    def visit_function_statement(self, s : stmt.Function) -> None:
+        s.slot = self.declare(s.name)
+        s.size = self.resolve_function(s.params, s.body)
+
+
+    def visit_return_statement(self, s : stmt.Return) -> None:
+        self.resolve_expression(s.value)
+
+
+    def visit_decorator_statement(self, s : stmt.Decorator) -> None:
+        self.resolve_expression(s.decorator)
+        self.resolve_statements(s.function)
+
+
+    # EXPRESSIONS
+
+    def visit_binary_expression(self, e : expr.Binary) -> None:
+        self.resolve_expression(e.left)
+        self.resolve_expression(e.right)
+
+
+    def visit_call_expression(self, e : expr.Call) -> None:
+        self.resolve_expression(e.callee)
+        for argument in e.arguments:
+            self.resolve_expression(argument)
+
+
+    def visit_logical_expression(self, e : expr.Logical) -> None:
+        self.resolve_expression(e.left)
+        self.resolve_expression(e.right)
+
+
+    def visit_grouping_expression(self, e : expr.Grouping) -> None:
+        self.resolve_expression(e.expression)
+
+
+    def visit_literal_expression(self, e : expr.Literal) -> None:
+        pass
+
+
+    def visit_unary_expression(self, e : expr.Unary) -> None:
+        self.resolve_expression(e.right)
+
+
+    def visit_variable_exression(self, e : expr.Variable) -> None:
+        for depth, scope in enumerate(reversed(self.scopes)):
+            if e.name.value in scope:
+                e.depth = depth
+                e.slot = scope[e.name.value]
+                return
+        e.depth = None
+        self.global_references.append(e)
+
+
+    def visit_assignment_expression(self, e : expr.Assignment) -> None:
+        self.resolve_expression(e.expression)
+        self.resolve_expression(e.name)
+
+
+    def visit_index_expression(self, e : expr.Index) -> None:
+        self.resolve_expression(e.list)
+        self.resolve_expression(e.index)
+
+
+    def visit_slice_expression(self, e : expr.Slice) -> None:
+        self.resolve_expression(e.list)
+        self.resolve_expression(e.start)
+        self.resolve_expression(e.stop)
+        self.resolve_expression(e.step)
+
+
+    def visit_list_expression(self, e : expr.ListExpr) -> None:
+        for element in e.value:
+            self.resolve_expression(element)
+
+
+    def visit_lambda_expression(self, e : expr.Lambda) -> None:
+        e.size = self.resolve_function(e.parameters, e.expression)
+
+
+    def visit_ternary_expression(self, e : expr.Ternary) -> None:
+        self.resolve_expression(e.condition)
+        self.resolve_expression(e.if_condition)
+        self.resolve_expression(e.else_condition)
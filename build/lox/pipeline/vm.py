@@ -0,0 +1,379 @@
+from typing import Dict, List
+
+from lox.environment import UNDEFINED
+from lox.loxcallable import LoxCallable, Print, Printf
+from lox.pipeline.compiler import Code, OpCode, BINARY_FALLBACKS
+
+
+CONSTANT, POP, GET_LOCAL, SET_LOCAL = OpCode.CONSTANT.value, OpCode.POP.value, OpCode.GET_LOCAL.value, OpCode.SET_LOCAL.value
+GET_GLOBAL, SET_GLOBAL, DEFINE_GLOBAL = OpCode.GET_GLOBAL.value, OpCode.SET_GLOBAL.value, OpCode.DEFINE_GLOBAL.value
+GET_UPVALUE, SET_UPVALUE = OpCode.GET_UPVALUE.value, OpCode.SET_UPVALUE.value
+ADD, SUBTRACT, MULTIPLY, DIVIDE = OpCode.ADD.value, OpCode.SUBTRACT.value, OpCode.MULTIPLY.value, OpCode.DIVIDE.value
+EQUAL, NOT_EQUAL, GREATER, GREATER_EQUAL = OpCode.EQUAL.value, OpCode.NOT_EQUAL.value, OpCode.GREATER.value, OpCode.GREATER_EQUAL.value
+LESS, LESS_EQUAL, NOT, NEGATE = OpCode.LESS.value, OpCode.LESS_EQUAL.value, OpCode.NOT.value, OpCode.NEGATE.value
+JUMP, POP_JUMP_IF_FALSE = OpCode.JUMP.value, OpCode.POP_JUMP_IF_FALSE.value
+JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP = OpCode.JUMP_IF_FALSE_OR_POP.value, OpCode.JUMP_IF_TRUE_OR_POP.value
+CALL, CLOSURE, CLOSE_UPVALUE, RETURN = OpCode.CALL.value, OpCode.CLOSURE.value, OpCode.CLOSE_UPVALUE.value, OpCode.RETURN.value
+BUILD_LIST, INDEX, SLICE, LEN, NIL = OpCode.BUILD_LIST.value, OpCode.INDEX.value, OpCode.SLICE.value, OpCode.LEN.value, OpCode.NIL.value
+TAIL_CALL, CHECK_DEFINED = OpCode.TAIL_CALL.value, OpCode.CHECK_DEFINED.value
+
+
+
+class Upvalue:
+    """a variable captured by a closure. while open it points at a stack slot, once closed it holds the value"""
+
+    __slots__ = ('index', 'value', 'closed')
+
+    def __init__(self, index : int) -> None:
+        self.index = index
+        self.value = None
+        self.closed = False
+
+
+
+class VMClosure(LoxCallable):
+    """a user-defined function (or lambda) running on the VM: its code object plus captured upvalues"""
+
+    __slots__ = ('code', 'upvalues', 'vm')
+
+    def __init__(self, code : Code, upvalues : List[Upvalue], vm : 'VM') -> None:
+        self.code = code
+        self.upvalues = upvalues
+        self.vm = vm
+
+    def call(self, interpreter, arguments):
+        return self.vm.call_closure(self, arguments)
+
+    def arity(self) -> int:
+        return self.code.arity
+
+    def __repr__(self) -> str:
+        if self.code.name is None:
+            return f"<user-defined anonymous function>"
+        return f"<user-defined fn {self.code.name}>"
+
+
+
+class Frame:
+
+    __slots__ = ('closure', 'ip', 'base')
+
+    def __init__(self, closure : VMClosure, base : int) -> None:
+        self.closure = closure
+        self.ip = 0
+        self.base = base
+
+
+
+class VM:
+    """
+    Stack machine executing the bytecode produced by the Compiler.
+
+    Calls between VM closures push a Frame instead of recursing in python, and returns simply truncate the value
+    stack, so there is no per-call Environment and no exception unwinding. Tail calls reuse the caller's Frame, and
+    more than the interpreter's max_depth frames is reported as a stack overflow. Natives (and functions created by the
+    other engines) are called through the LoxCallable protocol. Runtime errors are reported through the Interpreter.
+    """
+
+    def __init__(self, interpreter) -> None:
+        self.interpreter = interpreter
+        self.globals = interpreter.globals
+        self.stack : List = []
+        self.frames : List[Frame] = []
+        self.open_upvalues : Dict[int, Upvalue] = {}
+        self.first_line : int = interpreter.last_line
+        self.max_depth : int = interpreter.max_depth
+
+
+    def interpret(self, script : Code) -> None:
+        closure = VMClosure(script, [], self)
+        self.stack.append(closure)
+        self.frames.append(Frame(closure, 0))
+        self.execute(0)
+        # like Interpreter.interpret, count the top level statements that were run
+        self.interpreter.last_line = self.first_line + (script.ordinals[-1] + 1 if len(script.statements) > 1 else 0)
+
+
+    def call_closure(self, closure : VMClosure, arguments : List):
+        """call into the VM from python (eg. from a native function), running until the closure returns"""
+        if len(arguments) != closure.code.arity:
+            self.error(f"The function expected {closure.code.arity} arguments but received {len(arguments)} arguments")
+        if len(self.frames) > self.max_depth:
+            self.error("stack overflow")
+        depth = len(self.frames)
+        self.frames.append(Frame(closure, len(self.stack)))
+        self.stack.append(closure)
+        self.stack.extend(arguments)
+        return self.execute(depth)
+
+
+    def error(self, message : str) -> None:
+        """report a runtime error at the current instruction of the innermost frame"""
+        frame = self.frames[-1]
+        code = frame.closure.code
+        statement = code.lines[max(frame.ip - 2, 0) // 2]
+        self.interpreter.last_executed_statement = code.statements[statement]
+        script = self.frames[0].closure.code
+        self.interpreter.last_line = self.first_line + script.ordinals[script.lines[max(self.frames[0].ip - 2, 0) // 2]]
+        self.interpreter.report(message)
+
+
+    def capture(self, index : int) -> Upvalue:
+        upvalue = self.open_upvalues.get(index)
+        if upvalue is None:
+            upvalue = self.open_upvalues[index] = Upvalue(index)
+        return upvalue
+
+
+    def close_upvalues(self, base : int) -> None:
+        """close every open upvalue pointing at stack slot `base` or above"""
+        stack = self.stack
+        for index in [index for index in self.open_upvalues if index >= base]:
+            upvalue = self.open_upvalues.pop(index)
+            upvalue.value = stack[index]
+            upvalue.closed = True
+
+
+    def call_value(self, callee, arguments : List):
+        """call anything that is not a VM closure of this VM, with the same checks as Interpreter.call"""
+        if not hasattr(callee, "call"):
+            self.error("can't call a non-callable object")
+        if not (isinstance(callee, Print) or isinstance(callee, Printf)) and len(arguments) != callee.arity():
+            self.error(f"The function expected {callee.arity()} arguments but received {len(arguments)} arguments")
+        return callee.call(self.interpreter, arguments)
+
+
+    def execute(self, depth : int):
+        """the dispatch loop. runs until the frame count drops back to `depth`, returning the last returned value"""
+        stack, frames = self.stack, self.frames
+        push, pop = stack.append, stack.pop
+        global_values = self.globals.values
+        max_depth = self.max_depth
+
+        frame = frames[-1]
+        closure = frame.closure
+        code, constants, upvalues = closure.code.instructions, closure.code.constants, closure.upvalues
+        ip, base = frame.ip, frame.base
+
+        while True:
+            op = code[ip]
+            ip += 2
+
+            if op == GET_LOCAL:
+                push(stack[base + code[ip - 1]])
+
+            elif op == CONSTANT:
+                push(constants[code[ip - 1]])
+
+            elif op == GET_GLOBAL:
+                value = global_values[code[ip - 1]]
+                if value is UNDEFINED:
+                    frame.ip = ip
+                    self.error("Variables must be declared before use!")
+                push(value)
+
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    ip = code[ip - 1]
+
+            elif op == ADD:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a + b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == SUBTRACT:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a - b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == LESS:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a < b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == LESS_EQUAL:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a <= b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == GREATER:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a > b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == GREATER_EQUAL:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a >= b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == MULTIPLY:
+                b = pop()
+                stack[-1] = BINARY_FALLBACKS[op](stack[-1], b)
+
+            elif op == CALL:
+                argument_count = code[ip - 1]
+                callee = stack[-argument_count - 1]
+                if type(callee) is VMClosure and callee.vm is self:
+                    if callee.code.arity != argument_count:
+                        frame.ip = ip
+                        self.error(f"The function expected {callee.code.arity} arguments but received {argument_count} arguments")
+                    frame.ip = ip
+                    if len(frames) > max_depth:
+                        self.error("stack overflow")
+                    frame = Frame(callee, len(stack) - argument_count - 1)
+                    frames.append(frame)
+                    closure = callee
+                    code, constants, upvalues = closure.code.instructions, closure.code.constants, closure.upvalues
+                    ip, base = 0, frame.base
+                else:
+                    frame.ip = ip
+                    arguments = stack[len(stack) - argument_count:]
+                    del stack[len(stack) - argument_count - 1:]
+                    push(self.call_value(callee, arguments))
+
+            elif op == RETURN:
+                result = pop()
+                if self.open_upvalues:
+                    self.close_upvalues(base)
+                del stack[base:]
+                frames.pop()
+                if len(frames) == depth:
+                    return result
+                push(result)
+                frame = frames[-1]
+                closure = frame.closure
+                code, constants, upvalues = closure.code.instructions, closure.code.constants, closure.upvalues
+                ip, base = frame.ip, frame.base
+
+            elif op == SET_LOCAL:
+                stack[base + code[ip - 1]] = stack[-1]
+
+            elif op == POP:
+                pop()
+
+            elif op == JUMP:
+                ip = code[ip - 1]
+
+            elif op == GET_UPVALUE:
+                upvalue = upvalues[code[ip - 1]]
+                push(upvalue.value if upvalue.closed else stack[upvalue.index])
+
+            elif op == SET_UPVALUE:
+                upvalue = upvalues[code[ip - 1]]
+                if upvalue.closed:
+                    upvalue.value = stack[-1]
+                else:
+                    stack[upvalue.index] = stack[-1]
+
+            elif op == SET_GLOBAL:
+                global_values[code[ip - 1]] = stack[-1]
+
+            elif op == DEFINE_GLOBAL:
+                global_values[code[ip - 1]] = pop()
+
+            elif op == NIL:
+                push(None)
+
+            elif op == EQUAL:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a == b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == NOT_EQUAL:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a != b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == DIVIDE:
+                b = pop()
+                a = stack[-1]
+                stack[-1] = a / b if type(a) is type(b) else BINARY_FALLBACKS[op](a, b)
+
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+
+            elif op == NEGATE:
+                if type(stack[-1]) != float:
+                    frame.ip = ip
+                    self.error("Can't negate a non-numeric value!")
+                stack[-1] = -stack[-1]
+
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if not stack[-1]:
+                    ip = code[ip - 1]
+                else:
+                    pop()
+
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    ip = code[ip - 1]
+                else:
+                    pop()
+
+            elif op == TAIL_CALL:
+                argument_count = code[ip - 1]
+                callee = stack[-argument_count - 1]
+                if type(callee) is VMClosure and callee.vm is self:
+                    if callee.code.arity != argument_count:
+                        frame.ip = ip
+                        self.error(f"The function expected {callee.code.arity} arguments but received {argument_count} arguments")
+                    # the returning frame is reused: its callee and locals are replaced by the new callee and arguments
+                    if self.open_upvalues:
+                        self.close_upvalues(base)
+                    stack[base:] = stack[len(stack) - argument_count - 1:]
+                    frame = Frame(callee, base)
+                    frames[-1] = frame
+                    closure = callee
+                    code, constants, upvalues = closure.code.instructions, closure.code.constants, closure.upvalues
+                    ip = 0
+                else: # the RETURN that follows returns the result
+                    frame.ip = ip
+                    arguments = stack[len(stack) - argument_count:]
+                    del stack[len(stack) - argument_count - 1:]
+                    push(self.call_value(callee, arguments))
+
+            elif op == CLOSURE:
+                function = constants[code[ip - 1]]
+                captured = []
+                for _ in range(function.upvalue_count):
+                    is_local, index = code[ip], code[ip + 1]
+                    ip += 2
+                    captured.append(self.capture(base + index) if is_local else upvalues[index])
+                push(VMClosure(function, captured, self))
+
+            elif op == CLOSE_UPVALUE:
+                self.close_upvalues(len(stack) - 1)
+                pop()
+
+            elif op == INDEX:
+                index = pop()
+                try:
+                    stack[-1] = stack[-1][int(index)]
+                except:
+                    frame.ip = ip
+                    self.error("Couldn't perform indexing")
+
+            elif op == SLICE:
+                step, stop, start = pop(), pop(), pop()
+                try:
+                    stack[-1] = list(stack[-1][int(start) : int(stop) : int(step)])
+                except:
+                    frame.ip = ip
+                    self.error("can't slice dat")
+
+            elif op == BUILD_LIST:
+                count = code[ip - 1]
+                elements = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                push(elements)
+
+            elif op == LEN:
+                stack[-1] = float(len(stack[-1]))
+
+            elif op == CHECK_DEFINED:
+                if stack[-1] is UNDEFINED:
+                    frame.ip = ip
+                    self.error("Variables must be declared before use!")
+
+            else:
+                raise RuntimeError(f"unknown opcode {op}")
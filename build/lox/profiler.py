@@ -0,0 +1,136 @@
+"""
+tracing profiler for Lox programs (plox script.lox --profile)
+
+ProfilingInterpreter is a tree-walking Interpreter that additionally records, for every Lox call, the call count,
+inclusive and exclusive time of the callee, and for every statement executed, a hit on its source line. The plain
+Interpreter has no profiling hooks at all, so there is no cost when profiling is off. Results are written as a text
+report and as collapsed stacks (one `frame;frame;frame microseconds` line per distinct stack) that flamegraph.pl,
+speedscope or inferno can turn into a flamegraph. Like any tracing profiler of a language with proper tail calls,
+a chain of tail calls (`return f(...)`) shows up as the single call that started it.
+"""
+
+from typing import Dict, List, Optional, Tuple, Union
+from time import perf_counter
+import os
+
+from lox import stmt
+from lox import utils
+from lox.loxcallable import LoxFunction, LoxLambda
+from lox.pipeline import interpreter
+
+
+SCRIPT = ('<script>', None, None) # the frame for top level code
+
+
+
+class FunctionStats:
+
+    __slots__ = ('calls', 'inclusive', 'exclusive', 'active')
+
+    def __init__(self):
+        self.calls : int = 0
+        self.inclusive : float = 0.0
+        self.exclusive : float = 0.0
+        self.active : int = 0 # how many frames of this function are on the stack, so recursion isn't counted twice
+
+
+
+def describe(callee) -> Tuple[str, Optional[int], Optional[int]]:
+    """(name, line, column) of what is being called"""
+    if isinstance(callee, LoxFunction):
+        return callee.declaration.name.value, callee.declaration.line, callee.declaration.column
+    if isinstance(callee, LoxLambda):
+        return '<lambda>', callee.expression.line, callee.expression.column
+    return repr(callee), None, None
+
+
+def frame_name(function : Tuple[str, Optional[int], Optional[int]]) -> str:
+    name, line, _ = function
+    return name if line is None else f"{name}:{line}"
+
+
+
+class ProfilingInterpreter(interpreter.Interpreter):
+
+    def __init__(self, max_depth : int = interpreter.MAX_CALL_DEPTH):
+        super().__init__(max_depth)
+        self.functions : Dict[Tuple, FunctionStats] = {}
+        self.line_hits : Dict[int, int] = {}
+        self.stacks : Dict[str, float] = {} # collapsed stack -> exclusive time spent in it
+        self.call_stack : List[list] = [] # [function, stack, start time, time spent in callees]
+
+
+    def interpret(self, statements : Union[List[stmt.Stmt],stmt.Stmt]):
+        if type(statements) == list:
+            self.enter(SCRIPT)
+            try:
+                super().interpret(statements)
+            finally:
+                self.leave()
+        else:
+            if statements.line is not None:
+                self.line_hits[statements.line] = self.line_hits.get(statements.line, 0) + 1
+            return super().interpret(statements)
+
+
+    def call(self, callee, arguments : List):
+        self.enter(describe(callee))
+        try:
+            return super().call(callee, arguments)
+        finally:
+            self.leave()
+
+
+    def enter(self, function : Tuple) -> None:
+        stats = self.functions.get(function)
+        if stats is None:
+            stats = self.functions[function] = FunctionStats()
+        stats.calls += 1
+        stats.active += 1
+        stack = f"{self.call_stack[-1][1]};{frame_name(function)}" if self.call_stack else frame_name(function)
+        self.call_stack.append([function, stack, perf_counter(), 0.0])
+
+
+    def leave(self) -> None:
+        function, stack, start, in_callees = self.call_stack.pop()
+        elapsed = perf_counter() - start
+        stats = self.functions[function]
+        stats.active -= 1
+        if not stats.active:
+            stats.inclusive += elapsed
+        stats.exclusive += elapsed - in_callees
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + elapsed - in_callees
+        if self.call_stack:
+            self.call_stack[-1][3] += elapsed
+
+
+    def text_report(self, file : str) -> str:
+        """the text report: functions by exclusive time, then hits per source line"""
+        functions = sorted(self.functions.items(), key = lambda item : item[1].exclusive, reverse = True)
+        lines = [f"profile of {file}", "",
+                 f"{'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14} {'per call us':>12}  function"]
+        for function, stats in functions:
+            name, line, column = function
+            location = '' if line is None else f"  ({os.path.basename(file)}:{line}:{column})"
+            lines.append(f"{stats.calls:>10} {stats.inclusive*1e3:>14.3f} {stats.exclusive*1e3:>14.3f} "
+                         f"{stats.exclusive/stats.calls*1e6:>12.2f}  {name}{location}")
+
+        lines += ["", f"{'line':>6} {'hits':>10}  source"]
+        for line, hits in sorted(self.line_hits.items()):
+            lines.append(f"{line:>6} {hits:>10}  {utils.nth_line_of_string(self.state.currently_executing_program, line-1).rstrip()}")
+        return '\n'.join(lines) + '\n'
+
+
+    def collapsed_stacks(self) -> str:
+        """one `<script>;caller;callee microseconds` line per distinct call stack"""
+        return ''.join(f"{stack} {round(elapsed*1e6)}\n" for stack, elapsed in sorted(self.stacks.items()))
+
+
+    def write(self, file : str) -> Tuple[str, str]:
+        """write `file`.profile.txt and `file`.folded, returning their paths"""
+        report_path, folded_path = f"{file}.profile.txt", f"{file}.folded"
+        with open(report_path, 'w') as f:
+            f.write(self.text_report(file))
+        with open(folded_path, 'w') as f:
+            f.write(self.collapsed_stacks())
+        return report_path, folded_path
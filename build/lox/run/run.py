@@ -1,32 +1,84 @@
+from typing import List, Optional
+
 from lox import state 
+from lox import stmt 
+from lox import cache 
 from lox.pipeline import lexer 
 from lox.pipeline import parser
-from lox import errortypes
+from lox.pipeline import resolver
+from lox.pipeline import closure_compiler
+from lox.pipeline import compiler
+from lox.pipeline import vm
+from lox import errors
 
 from lox.pipeline import interpreter
 
-def run(string : str, interpreter_lox : interpreter.Interpreter) -> None:
-
-    state.currently_executing_program = string
-
-    if errortypes.mismatch(string):
-        print("\n\nLexer uninitialized due to errors caught before Lexing!\n")
-        return [] 
-    
-    alex = lexer.Lexer(string)
-    lexed_tokens = alex.lex()
-
-    if lexed_tokens:
-        #print(lexed_tokens)
-        happy = parser.Parser(lexed_tokens)
-        new = happy.parse()
-        #print(new)
-        if new: 
-            try:
-                interpreter_lox.interpret(new)
-            except:
-                pass 
+def parse(string : str) -> Optional[List[stmt.Stmt]]:
+    """lex and parse `string`, returning None (after reporting every error in it) if that doesn't produce a program"""
+
+    alex = lexer.Lexer(string, recover = True)
+    happy = parser.Parser(alex.stream(), recover = True)
+
+    if happy.end():
+        print("no lex")
+        return None 
+
+    new = happy.parse()
+    current = state.current()
+    if not new or current.error_flag: 
+        print("no parse")
+        if not current.error_flag: 
+            errors.record("ParseError", "no parse", current.current_file_name, None)
+        return None 
+    return new 
+
+
+def execute(new : List[stmt.Stmt], interpreter_lox : interpreter.Interpreter, engine : str = 'tree') -> None:
+    """resolve and run a parsed program with the chosen engine, allowing it at most as many nested calls as it can
+    make (see interpreter.CALL_DEPTH_LIMITS)"""
+
+    interpreter_lox.max_depth = min(interpreter_lox.max_depth, interpreter.CALL_DEPTH_LIMITS[engine])
+    try:
+        if not resolver.Resolver(interpreter_lox).resolve(new):
+            return 
+        if engine == 'closure':
+            closure_compiler.ClosureCompiler(interpreter_lox).execute(new)
+        elif engine == 'vm':
+            vm.VM(interpreter_lox).interpret(compiler.Compiler(interpreter_lox).compile(new))
         else:
-            print("no parse")
-    else:
-        print("no lex")
\ No newline at end of file
+            interpreter_lox.interpret(new)
+    except errors.LoxError: # reported and recorded already
+        pass 
+    except RecursionError: # python's recursion limit was reached before max_depth (see interpreter.CALL_DEPTH_LIMITS)
+        try:
+            interpreter_lox.report("stack overflow")
+        except errors.LoxError:
+            pass 
+    except Exception as error: # a bug in plox rather than in the program. don't crash, but don't hide it either
+        message = f"{type(error).__name__}: {error}"
+        if interpreter_lox.state.echo:
+            print(f"\nfile {interpreter_lox.state.current_file_name}")
+            print(f"InternalError: {message}")
+        errors.record("InternalError", message, interpreter_lox.state.current_file_name, None)
+    except (KeyboardInterrupt, SystemExit): # not errors in the program: stop it and leave them to the caller (eg. the REPL)
+        raise 
+
+
+def run(string : str, interpreter_lox : interpreter.Interpreter, engine : str = 'tree', cache_file : Optional[str] = None) -> None:
+    """lex, parse, resolve and execute `string`. engine is one of 'tree' (the tree-walking Interpreter),
+    'closure' (compile the program to python closures first, see ClosureCompiler) or 'vm' (compile the program to
+    bytecode and run it on the stack VM). if cache_file is given, the parsed program is looked up in (and saved to)
+    the on-disk cache for that script. errors are printed and recorded on interpreter_lox.state"""
+
+    with state.use(interpreter_lox.state), interpreter.python_recursion_limit():
+        interpreter_lox.state.currently_executing_program = string
+
+        new = cache.load(cache_file, string) if cache_file else None
+        if new is None:
+            new = parse(string)
+            if new is None:
+                return 
+            if cache_file:
+                cache.store(cache_file, string, new)
+
+        execute(new, interpreter_lox, engine)
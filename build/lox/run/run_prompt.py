@@ -3,20 +3,19 @@ import sys
 import termios 
 import tty 
 
-from lox import state  
 from lox.run import run 
 from lox.pipeline import interpreter
 
 
-def run_prompt():
+def run_prompt(engine : str = 'tree', max_depth : int = interpreter.MAX_CALL_DEPTH):
     print('Welcome to pLox!\n')
-    pretty = interpreter.Interpreter()
+    pretty = interpreter.Interpreter(max_depth)
     while True: 
         try:
             print('lox> ', end='')
             line = input()
-            run.run(line+'\n', pretty)
-            state.error_flag = False 
+            run.run(line+'\n', pretty, engine)
+            pretty.state.reset_error_flag()
         except KeyboardInterrupt:
             print("\nKeyboard Interrupt (Press ctrl+D to exit)")
         except EOFError:
@@ -1,19 +1,28 @@
 import sys 
 
 from lox.run import run
-from lox import state 
+from lox import profiler
 from lox.pipeline import interpreter
 
-def run_script(file):
+def run_script(file, engine : str = 'tree', use_cache : bool = True, profile : bool = False, max_depth : int = interpreter.MAX_CALL_DEPTH):
     f = open(file, 'r')
     contents = f.read()
-    state.reset_state()
-    state.current_file_name = file 
-    p = interpreter.Interpreter()
-    run.run(contents,p)
-    if state.error_flag:
+    if profile: # the profiler hooks into the tree-walking interpreter, whatever engine was asked for
+        p = profiler.ProfilingInterpreter(max_depth)
+        engine = 'tree'
+    else:
+        p = interpreter.Interpreter(max_depth)
+    p.state.current_file_name = file 
+    try:
+        run.run(contents, p, engine, file if use_cache else None)
+    except KeyboardInterrupt:
+        sys.exit("\nKeyboard Interrupt")
+    if profile and p.functions: # nothing ran if the script didn't parse
+        report, folded = p.write(file)
+        print(f"\nprofile written to {report}, collapsed stacks (for flamegraph.pl) to {folded}")
+    if p.state.error_flag:
         sys.exit()
 
 
 if __name__ == '__main__':
-    run_script(sys.argv[1])
\ No newline at end of file
+    run_script(sys.argv[1], 'vm' if '--vm' in sys.argv else 'closure' if '--optimize' in sys.argv else 'tree', '--no-cache' not in sys.argv, '--profile' in sys.argv)
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+evaluation server: runs submitted Lox programs concurrently, in a pool of warm worker processes
+
+    plox --serve [--socket=PATH] [--workers=N] [--timeout=SECONDS]
+
+Requests and responses are JSON objects, one per line, read from stdin and written to stdout, or exchanged over each
+connection to the unix socket at PATH. A request looks like
+
+    {"id": 1, "source": "print(1 + 2);", "engine": "tree", "timeout": 5, "stdin": ""}
+
+where only source is required, and is answered with
+
+    {"id": 1, "ok": true, "output": "3.0 \n", "errors": [], "time": 0.0004}
+
+Responses are written as soon as their job finishes, so they can come back out of order: match them up by id.
+errors lists what the program reported, as {type, message, file, line, column}: LexError, ParseError, ResolveError
+and RuntimeError, plus Timeout when the job ran out of time (its worker is killed and replaced), BadRequest and
+InternalError, for bugs in plox and for jobs whose worker died (it is replaced too). Every job gets a fresh Interpreter,
+so jobs never see each other's globals.
+"""
+
+from typing import Callable, Iterable, Optional
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lox.run import run
+from lox.pipeline import interpreter
+
+
+ENGINES = {'tree', 'closure', 'vm'}
+DEFAULT_TIMEOUT = 10.0 # seconds
+
+
+
+def run_job(job : dict) -> dict:
+    """run one job in this process, with a fresh interpreter, the job's stdin and captured stdout"""
+    interpreter_lox = interpreter.Interpreter()
+    interpreter_lox.state.current_file_name = job.get('file', '<job>')
+    output = io.StringIO()
+    stdin, sys.stdin = sys.stdin, io.StringIO(job.get('stdin', ''))
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            run.run(job['source'], interpreter_lox, job.get('engine', 'tree'))
+    finally:
+        sys.stdin = stdin
+    return {'ok' : not interpreter_lox.state.error_flag, 'output' : output.getvalue(),
+            'errors' : [error.as_dict() for error in interpreter_lox.state.errors], 'time' : time.perf_counter() - start}
+
+
+def failure(type : str, message : str, output : str = '') -> dict:
+    return {'ok' : False, 'output' : output, 'time' : None,
+            'errors' : [{'type' : type, 'message' : message, 'file' : None, 'line' : None, 'column' : None}]}
+
+
+def work(connection) -> None:
+    """worker process: run the jobs sent over `connection`, one at a time, until it is closed"""
+    sys.stdout = sys.stderr # stdout may be the server's response stream: nothing but job output may go there
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        try:
+            result = run_job(job)
+        except Exception as error:
+            result = failure('InternalError', f"{type(error).__name__}: {error}")
+        connection.send(result)
+
+
+
+class Worker:
+
+    def __init__(self, context) -> None:
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target = work, args = (child,), daemon = True)
+        self.process.start()
+        child.close()
+        self.usable : bool = True # false once a job timed out or the process died: the worker has to be replaced
+
+    def run(self, job : dict, timeout : float) -> dict:
+        """the result of the job, or a Timeout (it didn't finish in time) or InternalError (the worker died) failure"""
+        try:
+            self.connection.send(job)
+            if not self.connection.poll(timeout): # a dead worker closes the pipe, which poll reports right away
+                self.usable = False
+                return failure('Timeout', f"the job didn't finish in {timeout} seconds")
+            return self.connection.recv()
+        except (EOFError, OSError):
+            self.usable = False
+            self.process.join(1)
+            return failure('InternalError', f"the worker running the job died (exit code {self.process.exitcode})")
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+
+class Pool:
+    """a fixed number of worker processes, started up front and reused, each running one job at a time"""
+
+    def __init__(self, workers : Optional[int] = None, timeout : float = DEFAULT_TIMEOUT) -> None:
+        self.size = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        # forked from a clean process that has already imported lox, rather than from this (threaded) one
+        self.context = multiprocessing.get_context('forkserver')
+        self.context.set_forkserver_preload(['lox.server'])
+        self.workers = [Worker(self.context) for _ in range(self.size)]
+        self.idle : queue.Queue = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+
+    def run(self, job : dict) -> dict:
+        """run a job on the next idle worker, replacing the worker if the job times out or kills it"""
+        if not isinstance(job, dict) or not isinstance(job.get('source'), str):
+            return failure('BadRequest', "a job is an object with a 'source' string")
+        if job.get('engine', 'tree') not in ENGINES:
+            return failure('BadRequest', f"engine must be one of {', '.join(sorted(ENGINES))}")
+        timeout = job.get('timeout', self.timeout)
+        if type(timeout) not in (int, float) or timeout <= 0:
+            return failure('BadRequest', "timeout must be a positive number of seconds")
+
+        worker = self.idle.get()
+        try:
+            result = worker.run({key : job[key] for key in ('source', 'engine', 'stdin', 'file') if key in job}, timeout)
+            if not worker.usable:
+                worker.kill()
+                self.workers.remove(worker)
+                worker = Worker(self.context)
+                self.workers.append(worker)
+            return result
+        finally:
+            self.idle.put(worker)
+
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.kill()
+
+
+
+def answer(line : str, pool : Pool) -> dict:
+    try:
+        job = json.loads(line)
+    except ValueError as error:
+        return {'id' : None, **failure('BadRequest', f"invalid JSON: {error}")}
+    response = pool.run(job)
+    return {'id' : job.get('id') if isinstance(job, dict) else None, **response}
+
+
+def serve_lines(lines : Iterable[str], write : Callable[[str], None], pool : Pool) -> None:
+    """answer every JSON request line, with up to pool.size jobs running at once, writing responses as they finish"""
+    lock = threading.Lock()
+
+    def respond(line : str) -> None:
+        response = json.dumps(answer(line, pool))
+        with lock:
+            write(response + '\n')
+
+    with ThreadPoolExecutor(pool.size) as executor:
+        for line in lines:
+            if line.strip():
+                executor.submit(respond, line)
+
+
+def serve(socket_path : Optional[str] = None, workers : Optional[int] = None, timeout : float = DEFAULT_TIMEOUT) -> None:
+    """serve requests from stdin (or the unix socket at socket_path) until EOF (or ctrl+c, or SIGTERM). a socket left
+    at socket_path by an earlier server is replaced, anything else there raises FileExistsError"""
+    if socket_path is not None and os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise FileExistsError(f"{socket_path} exists and is not a socket")
+        os.remove(socket_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame : sys.exit())
+    pool = Pool(workers, timeout)
+    try:
+        if socket_path is None:
+            def write(text : str) -> None:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            serve_lines(sys.stdin, write, pool)
+            return
+
+        class Connection(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                def write(text : str) -> None:
+                    self.wfile.write(text.encode('utf-8'))
+                    self.wfile.flush()
+                serve_lines(io.TextIOWrapper(self.rfile, encoding = 'utf-8'), write, pool)
+
+        with socketserver.ThreadingUnixStreamServer(socket_path, Connection) as server:
+            print(f"plox server listening on {socket_path} with {pool.size} workers", file = sys.stderr)
+            try:
+                server.serve_forever()
+            except (KeyboardInterrupt, SystemExit):
+                pass
+            finally:
+                os.remove(socket_path)
+    finally:
+        pool.close()
@@ -1,34 +1,56 @@
 """
-global variables
+interpreter state
+
+KEYWORDS is a constant. Everything else that used to be a module level global (the error flag, the name and source of
+the program being run, the errors reported so far) lives in a State: every Interpreter owns one, and run.run makes it
+the current state while that interpreter runs, so interpreters in the same process never see each other's errors.
 """
 
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List
+
 #GLOBAL CONSTANTS:
 KEYWORDS = {'and', 'class', 'else', 'false', 'fun', 'for', 'if', 'nil', 'or', 'return', 'super', 'this', 'true', 'var', 'while', 'each', 'in'} #'scan', 'print'
 
 
-error_flag : bool = False 
-
-def reset_error_flag():
-    """ set the global error flag to false"""
-    global error_flag
-    error_flag = False 
 
+class State:
 
-current_file_name : str = '<stdin>'
-currently_executing_program : str = ''
+    def __init__(self, current_file_name : str = '<stdin>'):
+        self.error_flag : bool = False
+        self.current_file_name : str = current_file_name
+        self.currently_executing_program : str = ''
+        self.errors : List = [] # the errors.LoxError reported since the last reset
+        self.echo : bool = True # print errors as they are reported, rather than only recording them
 
+    def reset_error_flag(self) -> None:
+        """forget the errors of the previous program (or REPL line)"""
+        self.error_flag = False
+        self.errors = []
 
-pretty = None 
 
 
+# the state used outside of any interpreter, eg. when just lexing or parsing
+DEFAULT_STATE = State()
+_current : ContextVar[State] = ContextVar('state', default = DEFAULT_STATE)
 
-def reset_REPL() -> None: 
-    reset_error_flag()
 
+def current() -> State:
+    """the state of the interpreter that is running"""
+    return _current.get()
 
 
+@contextmanager
+def use(state : State) -> Iterator[State]:
+    """make `state` the current state for the duration of the with block"""
+    token = _current.set(state)
+    try:
+        yield state
+    finally:
+        _current.reset(token)
 
 
 def reset_state() -> None:
-    """set all global variables to default values"""
-    reset_REPL()
+    """set the current state back to default values"""
+    current().reset_error_flag()
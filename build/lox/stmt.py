@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Protocol, TypeVar, List, Union 
 
 from lox import tokens
@@ -48,6 +48,10 @@ class Visitor(Protocol[R]):
 
 class Stmt(ABC):
 
+    # source position of the first token of the statement (1-based line, 0-based column), set by the Parser
+    line : int = None 
+    column : int = None 
+
     @abstractmethod
     def accept(self, visitor: Visitor[R]): 
         pass 
@@ -55,6 +59,7 @@ class Stmt(ABC):
 @dataclass
 class Block(Stmt): 
     statements : List[Stmt]
+    size : int = field(default=0, repr=False, compare=False) #number of slots in the block's frame
 
     def accept(self, visitor: Visitor[R]):
         return visitor.visit_block_statement(self)
@@ -82,6 +87,7 @@ class For(Stmt):
     condition : expr.Expr 
     iter : expr.Expr 
     statement : Stmt 
+    size : int = field(default=0, repr=False, compare=False) #the loop's frame, which holds the variable declared in init
 
     def accept(self, visitor: Visitor[R]):
         return visitor.visit_for_statement(self)
@@ -92,6 +98,7 @@ class ForEach(Stmt):
     itervar : expr.Variable
     listvar : expr.ListExpr 
     statement : Stmt 
+    size : int = field(default=0, repr=False, compare=False)
 
     def accept(self, visitor: Visitor[R]):
         return visitor.visit_foreach_statement(self) 
@@ -108,6 +115,7 @@ class Expression(Stmt):
 class Var(Stmt):
     name : tokens.Token 
     initializer : expr.Expr
+    slot : int = field(default=None, repr=False, compare=False)
 
     def accept(self, visitor: Visitor[R]):
         return visitor.visit_variable_statement(self)
@@ -124,6 +132,8 @@ class Function(Stmt):
     name : tokens.Token
     params : List[tokens.Token]
     body : List[Stmt]
+    slot : int = field(default=None, repr=False, compare=False)
+    size : int = field(default=0, repr=False, compare=False)
 
     def accept(self, visitor : Visitor[R]):
         return visitor.visit_function_statement(self)
@@ -10,7 +10,7 @@ class TokenType(enum.Enum):
 
     #comments
     COMMENT = r'//.*\n'
-    MULTI_LINE_COMMENT = r'/\*(.|\n)*\*/'
+    MULTI_LINE_COMMENT = r'/\*(.|\n)*?\*/'
 
     #punctuation
     LEFT_PAREN = r'\('
@@ -43,7 +43,7 @@ class TokenType(enum.Enum):
 
     #literals/identifiers
     IDENTIFIER = r'[a-zA-Z_][a-zA-Z0-9_]*' 
-    STRING = r'"([^\\\"]*(\\(\\|n|t|\"))?[^\\\"]*)+"' 
+    STRING = r'"([^\\\"]|\\(\\|n|t|\"))*"' 
     NUMBER = r'[0-9]+(\.[0-9]+)?' 
     LIST = r'\[\]'
 
@@ -97,11 +97,11 @@ class Token:
 
 def safify(fun : typing.Callable) -> typing.Callable:
     if fun in {operator.add, operator.sub, operator.truediv}:
-        return lambda a, b : fun(a,b) if (type(a) == type(b)) else errors.report("RuntimeError", state.current_file_name, 1,1, f"Can't {a} {b}")
+        return lambda a, b : fun(a,b) if (type(a) == type(b)) else errors.report("RuntimeError", state.current().current_file_name, 1,1, f"Can't {a} {b}")
     elif fun in {operator.mul}:
-        return lambda a, b : fun(int(a),b) if (type(a) == float) else (fun(a,int(b)) if (type(b) == float) else errors.report("RuntimeError", state.current_file_name, 1,1, f"Can't {a} {b}"))
+        return lambda a, b : fun(int(a),b) if (type(a) == float) else (fun(a,int(b)) if (type(b) == float) else errors.report("RuntimeError", state.current().current_file_name, 1,1, f"Can't {a} {b}"))
     else:
-        return lambda a, b : fun(a,b) if (type(a) == type(b)) else errors.report("RuntimeError", state.current_file_name, 1,1, "Can't ")
+        return lambda a, b : fun(a,b) if (type(a) == type(b)) else errors.report("RuntimeError", state.current().current_file_name, 1,1, "Can't ")
 
 OPERATIONS = {
                 TokenType.PLUS: safify(operator.add),
@@ -146,6 +146,11 @@ LITERAL_CONSTANTS = {
                         TokenType.NIL : None 
                     }
 
+# tokens that begin a declaration or statement: where the Parser resumes after a syntax error
+SYNCHRONIZING_TOKENS = {TokenType.VAR, TokenType.FUN, TokenType.IF, TokenType.WHILE, TokenType.FOR, TokenType.RETURN, TokenType.AT}
+
 IGNORED_TOKENS = {TokenType.COMMENT, TokenType.MULTI_LINE_COMMENT, TokenType.SPACE, TokenType.NEWLINE, TokenType.TAB}
 
+KEYWORD_TOKENS = {keyword : TokenType[keyword.upper()] for keyword in state.KEYWORDS}
+
 
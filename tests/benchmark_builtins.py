@@ -0,0 +1,71 @@
+"""
+benchmark the native list builtins (range/map/filter/reduce/sum) against the equivalent hand-written Lox loops
+
+usage: python tests/benchmark_builtins.py [engine]   (defaults to: tree)
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build'))
+
+from lox.run import run
+from lox.pipeline import interpreter
+
+
+SIZE = 20000
+
+WORKLOADS = {
+    'sum': (f"""
+var xs = range(0, {SIZE});
+var total = 0;
+for each x in xs total = total + x;
+print(total);
+""", f"""
+print(sum(range(0, {SIZE})));
+"""),
+    'map/filter/reduce': (f"""
+fun triple(x) {{ return x * 3; }}
+fun big(x) {{ return x > 100; }}
+fun add(a, b) {{ return a + b; }}
+var xs = range(0, {SIZE});
+var total = 0;
+for each x in xs
+{{
+    var y = triple(x);
+    if (big(y)) total = add(total, y);
+}}
+print(total);
+""", f"""
+fun triple(x) {{ return x * 3; }}
+fun big(x) {{ return x > 100; }}
+fun add(a, b) {{ return a + b; }}
+print(reduce(add, filter(big, map(triple, range(0, {SIZE})))));
+"""),
+}
+
+
+def run_source(source, engine):
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run.run(source, interpreter.Interpreter(), engine)
+    return time.perf_counter() - start, output.getvalue()
+
+
+def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'tree'
+    for name, (loop, native) in WORKLOADS.items():
+        loop_time, loop_output = run_source(loop, engine)
+        native_time, native_output = run_source(native, engine)
+        assert loop_output == native_output, f"builtins disagree with the loop on {name}: {native_output!r} != {loop_output!r}"
+        print(f"{name}:")
+        print(f"    loop    : {loop_time:.4f}s")
+        print(f"    builtins: {native_time:.4f}s ({loop_time/native_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
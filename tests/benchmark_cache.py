@@ -0,0 +1,73 @@
+"""
+benchmark script startup with a cold and a warm parse cache, on a generated multi-thousand line script
+
+usage: python tests/benchmark_cache.py [functions]
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build'))
+
+from lox import cache
+from lox.run import run
+from lox.pipeline import interpreter
+
+
+FUNCTION = """
+fun f{0}(a, b)
+{{
+    var total = 0;
+    for (var i = 0; i < b; i = i + 1)
+    {{
+        if (i / 2 > a and !(i == 3)) total = total + i * {0}; else total = total - 1;
+    }}
+    return total;
+}}
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION.format(i) for i in range(functions)) + f"print(f{functions - 1}(1, 10));\n"
+
+
+def startup(file, source, use_cache):
+    interpreter_lox = interpreter.Interpreter()
+    interpreter_lox.state.current_file_name = file
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run.run(source, interpreter_lox, 'tree', file if use_cache else None)
+    return time.perf_counter() - start
+
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    directory = tempfile.mkdtemp()
+    try:
+        file = os.path.join(directory, 'generated.lox')
+        source = generate(functions)
+        with open(file, 'w') as f:
+            f.write(source)
+        print(f"script: {source.count(chr(10))} lines")
+
+        uncached = min(startup(file, source, False) for _ in range(3))
+        cold = []
+        for _ in range(3):
+            shutil.rmtree(os.path.join(directory, cache.CACHE_DIRECTORY), ignore_errors=True)
+            cold.append(startup(file, source, True))
+        warm = min(startup(file, source, True) for _ in range(3))
+
+        print(f"--no-cache : {uncached:.4f}s")
+        print(f"cold cache : {min(cold):.4f}s (parse + write entry)")
+        print(f"warm cache : {warm:.4f}s ({uncached/warm:.1f}x)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
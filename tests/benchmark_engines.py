@@ -0,0 +1,78 @@
+"""
+benchmark the execution engines on fibonacci.lox / fact.lox style workloads, checking that they agree on the output
+
+usage: python tests/benchmark_engines.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build'))
+
+from lox.run import run
+from lox.pipeline import interpreter
+
+
+WORKLOADS = {
+    'fibonacci': """
+fun fibonacci(n)
+{
+    if (n <= 2)
+        return n-1;
+    else
+        return fibonacci(n-1) + fibonacci(n-2);
+}
+for (var i = 1; i <= 22; i = i + 1)
+    print(fibonacci(i));
+""",
+    'factorial': """
+fun factorial(n)
+{
+    if (!n)
+        return 1;
+    else
+        return n * factorial(n-1);
+}
+var total = 0;
+for (var i = 0; i < 3000; i = i + 1)
+    total = total + factorial(25);
+print(total);
+""",
+    'loops': """
+var sum = 0;
+for (var i = 0; i < 100000; i = i + 1)
+{
+    var j = i * 2;
+    if (j > 10 and j < 100000) sum = sum + j; else sum = sum - 1;
+}
+print(sum);
+""",
+}
+
+ENGINES = ['tree', 'closure', 'vm']
+
+
+def run_engine(source, engine):
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run.run(source, interpreter.Interpreter(), engine)
+    return time.perf_counter() - start, output.getvalue()
+
+
+def main():
+    for name, source in WORKLOADS.items():
+        baseline_time, baseline_output = run_engine(source, ENGINES[0])
+        print(f"{name}:")
+        print(f"    {ENGINES[0]:8}: {baseline_time:.4f}s")
+        for engine in ENGINES[1:]:
+            elapsed, output = run_engine(source, engine)
+            assert output == baseline_output, f"{engine} engine output differs on {name}!"
+            print(f"    {engine:8}: {elapsed:.4f}s ({baseline_time/elapsed:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+benchmark single-line edits on a generated 10k line file: reparsing the whole file after every edit against
+reparsing only what the edit changed (incremental.Document). every incremental parse, errors included, is checked
+against the full parse of the same source. then check many random edits of a small program (unbalanced braces, half
+written comments and strings included) the same way
+
+usage: python tests/benchmark_incremental.py [edits] [lines] [random edits]   (defaults to: 30, 10000, 10000)
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build'))
+
+from lox import state, tokens
+from lox import expr, stmt
+from lox.pipeline import lexer, parser, incremental
+
+
+FUNCTION = """fun f{0}(a, b)
+{{
+    var total = 0;
+    for (var i = 0; i < b; i = i + 1)
+    {{
+        if (i / 2 > a and !(i == 3)) total = total + i * {0}; else total = total - 1;
+    }}
+    return total;
+}}
+var x{0} = f{0}(1, 10); // {0}
+"""
+
+
+# the random edits insert these, in place of 0 to 5 characters of the program
+SNIPPETS = ['', ';', '{', '}', '(', ')', '"', '/', '//', '//c\n', '/*', '*/', '\n', ' ', '$', '1', '+', 'x', 'fun',
+            'else', 'return 1;', 'var q = 1;', 'if (q) ', 'else print(3);', '\nfun h() {']
+
+RANDOM_PROGRAM = """fun f(a, b)
+{
+    var total = a; // running total
+    if (a > b) total = total - b; else { total = total + b; }
+    return total;
+}
+/* a comment */ var x = f(1, 2);
+print("x: " + x);
+if (x > 1) print(1);
+"""
+
+
+def generate(lines):
+    functions = lines // FUNCTION.count('\n')
+    return ''.join(FUNCTION.format(i) for i in range(functions)) + f"print(x{functions - 1});\n"
+
+
+def dump(node):
+    """everything about a parsed subtree, positions included, in a form that compares by value"""
+    if isinstance(node, list):
+        return [dump(item) for item in node]
+    if isinstance(node, tokens.Token):
+        return (node.type, node.value, node.row, node.column)
+    if isinstance(node, (expr.Expr, stmt.Stmt)):
+        return (type(node).__name__, node.line, node.column, {name : dump(value) for name, value in vars(node).items()})
+    return node
+
+
+def full_parse(source):
+    quiet = state.State('<document>')
+    quiet.echo = False
+    with state.use(quiet):
+        statements = parser.Parser(lexer.Lexer(source, recover = True).stream(), recover = True).parse()
+    return statements, quiet.errors
+
+
+def line_edits(source, kind):
+    """(start, end, text) edits of a random line of source: retyping a number in it (kind 0), inserting a line before
+    it (kind 1), or deleting its semicolon and then typing it back (kind 2)"""
+    while True:
+        start = source.rfind('\n', 0, random.randrange(len(source))) + 1
+        line = source[start:source.find('\n', start)]
+        if kind == 0 and (digit := next((i for i, c in enumerate(line) if c.isdigit()), None)) is not None:
+            return [(start + digit, start + digit + 1, str(random.randrange(10, 100)))]
+        elif kind == 1 and line.startswith('    var total'):
+            return [(start, start, "    var extra = 1;\n")]
+        elif kind == 2 and line.endswith(';'):
+            end = start + len(line)
+            return [(end - 1, end, ""), (end - 1, end - 1, ";")]
+
+
+def check(document, source, edit):
+    statements, errors = full_parse(source)
+    assert dump(document.statements()) == dump(statements), f"incremental parse differs after {edit}"
+    assert [error.as_dict() for error in document.errors()] == [error.as_dict() for error in errors], f"errors differ after {edit}"
+
+
+def random_edits(count):
+    """`count` random edits of RANDOM_PROGRAM, 20 in a row on each Document, each checked against a full parse"""
+    for _ in range(0, count, 20):
+        source = RANDOM_PROGRAM
+        document = incremental.Document(source)
+        for _ in range(20):
+            start = random.randrange(len(source) + 1)
+            end = min(len(source), start + random.choice([0, 0, 1, 2, 5]))
+            text = random.choice(SNIPPETS)
+            source = source[:start] + text + source[end:]
+            document.edit(start, end, text)
+            check(document, source, (start, end, text))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    trials = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    random.seed(0)
+    source = generate(lines)
+
+    start = time.perf_counter()
+    document = incremental.Document(source)
+    print(f"{source.count(chr(10))} lines, {len(document.chunks)} top level declarations, parsed in {time.perf_counter() - start:.3f}s")
+
+    full_times, incremental_times, reparsed = [], [], []
+    edits = []
+    while len(full_times) < count:
+        if not edits:
+            edits = line_edits(source, len(full_times) % 3)
+        edit_start, edit_end, text = edits.pop(0)
+        source = source[:edit_start] + text + source[edit_end:]
+
+        start = time.perf_counter()
+        statements, errors = full_parse(source)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        document.edit(edit_start, edit_end, text)
+        document_errors = document.errors()
+        document_statements = document.statements()
+        incremental_times.append(time.perf_counter() - start)
+        reparsed.append(document.reparsed)
+
+        assert dump(document_statements) == dump(statements), f"incremental parse differs after {(edit_start, edit_end, text)}"
+        assert [error.as_dict() for error in document_errors] == [error.as_dict() for error in errors]
+
+    full_time = sum(full_times) / len(full_times)
+    incremental_time = sum(incremental_times) / len(incremental_times)
+    print(f"{len(full_times)} single-line edits:")
+    print(f"    full reparse : {full_time*1e3:8.3f}ms per edit")
+    print(f"    incremental  : {incremental_time*1e3:8.3f}ms per edit, {max(incremental_times)*1e3:.3f}ms at most, "
+          f"{sum(reparsed)/len(reparsed):.1f} declarations reparsed ({full_time/incremental_time:.0f}x)")
+
+    random_edits(trials)
+    print(f"{trials} random edits of a small program: every one parsed as a full parse would")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+benchmark the combined-pattern lexer against the original pattern-by-pattern lexer on the examples/ corpus
+
+usage: python tests/benchmark_lexer.py [repetitions]
+"""
+
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build'))
+
+from lox import state
+from lox.pipeline import lexer
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', '*.lox')
+
+
+def token_tuples(lexer_class, source):
+    return [(t.type, t.value, t.position, t.row, t.column) for t in lexer_class(source).lex()]
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    corpus = [open(f).read() for f in sorted(glob.glob(EXAMPLES))]
+    source = '\n'.join(corpus) * repetitions
+    state.current().currently_executing_program = source
+
+    for program in corpus:
+        assert token_tuples(lexer.NaiveLexer, program) == token_tuples(lexer.Lexer, program), "lexers disagree!"
+
+    print(f"corpus: {len(corpus)} files x {repetitions} = {len(source)} characters")
+    naive = min(timeit.repeat(lambda: lexer.NaiveLexer(source).lex(), number=1, repeat=3))
+    combined = min(timeit.repeat(lambda: lexer.Lexer(source).lex(), number=1, repeat=3))
+    streamed = min(timeit.repeat(lambda: sum(1 for _ in lexer.Lexer(source).stream()), number=1, repeat=3))
+    print(f"naive lexer    : {naive:.4f}s")
+    print(f"combined lexer : {combined:.4f}s ({naive/combined:.1f}x)")
+    print(f"token stream   : {streamed:.4f}s ({naive/streamed:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+load test the evaluation server: jobs/sec of the warm worker pool (plox --serve) against starting a fresh
+`python plox` process per job
+
+usage: python tests/benchmark_server.py [jobs] [workers]   (defaults to: 200, the number of cpus)
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BUILD = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build')
+sys.path.insert(0, BUILD)
+
+from lox import server
+
+
+JOBS = [
+    ("""
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+print(fib(15));
+""", "610.0 \n"),
+    ("""
+var total = 0;
+for (var i = 0; i < 2000; i = i + 1) total = total + i;
+print(total);
+""", "1999000.0 \n"),
+    ("""
+print(sum(map(fun (x) => x * x, range(0, 500))));
+""", "41541750.0 \n"),
+    ("""
+print(undefined);
+""", None), # a resolve error: answered, just not ok
+]
+
+
+def job(i):
+    source, expected = JOBS[i % len(JOBS)]
+    return {'id' : i, 'source' : source, 'engine' : ('tree', 'closure', 'vm')[i % 3]}, expected
+
+
+def check(response, expected):
+    if expected is None:
+        assert not response['ok'], response
+    else:
+        assert response['ok'] and response['output'] == expected, response
+
+
+def per_process(jobs, workers):
+    """every job starts python, imports lox and runs the script: what running plox from a grader costs"""
+    directory = tempfile.mkdtemp()
+
+    def run(i):
+        request, expected = job(i)
+        path = os.path.join(directory, f"job{i}.lox")
+        with open(path, 'w') as f:
+            f.write(request['source'])
+        flag = {'tree' : [], 'closure' : ['--optimize'], 'vm' : ['--vm']}[request['engine']]
+        output = subprocess.run([sys.executable, 'plox', path, '--no-cache'] + flag, cwd = BUILD,
+                                capture_output = True, text = True).stdout
+        if expected is not None:
+            assert output == expected, output
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(run, range(jobs)))
+
+
+def pooled(pool, jobs, workers):
+    """every job is sent to an already running worker"""
+    def run(i):
+        request, expected = job(i)
+        check(pool.run(request), expected)
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(run, range(jobs)))
+
+
+def stdio(jobs, workers):
+    """the whole server, as a client sees it: JSON lines through plox --serve"""
+    requests = ''.join(json.dumps(job(i)[0]) + '\n' for i in range(jobs))
+    output = subprocess.run([sys.executable, 'plox', '--serve', f'--workers={workers}'], cwd = BUILD, input = requests,
+                            capture_output = True, text = True).stdout
+    responses = {response['id'] : response for response in map(json.loads, output.splitlines())}
+    assert len(responses) == jobs, f"{len(responses)} responses to {jobs} jobs"
+    for i, response in responses.items():
+        check(response, job(i)[1])
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    print(f"{jobs} jobs, {workers} workers:")
+
+    start = time.perf_counter()
+    per_process(jobs, workers)
+    cold = time.perf_counter() - start
+    print(f"    process per job     : {jobs/cold:8.1f} jobs/s")
+
+    start = time.perf_counter()
+    stdio(jobs, workers)
+    served = time.perf_counter() - start
+    print(f"    plox --serve        : {jobs/served:8.1f} jobs/s, including server startup ({cold/served:.1f}x)")
+
+    pool = server.Pool(workers)
+    try:
+        pooled(pool, workers, workers) # warm up every worker
+        start = time.perf_counter()
+        pooled(pool, jobs, workers)
+        warm = time.perf_counter() - start
+    finally:
+        pool.close()
+    print(f"    warm pool           : {jobs/warm:8.1f} jobs/s ({cold/warm:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
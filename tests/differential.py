@@ -0,0 +1,98 @@
+"""
+differential test harness: run every examples/*.lox program, and the regression programs below, under the
+tree-walking interpreter and under the other execution engines, and check that they print exactly the same thing
+
+usage: python tests/differential.py [engine ...]   (defaults to: vm closure)
+"""
+
+import contextlib
+import glob
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build'))
+
+from lox import loxcallable
+from lox.run import run
+from lox.pipeline import interpreter
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', '*.lox')
+STDIN = "10\n" * 16 # answers for scan()
+
+# programs on which the engines once disagreed
+PROGRAMS = {
+    'hoisted function read before its declaration' : """
+fun outer()
+{
+    fun even(n) { if (n == 0) return true; return odd(n - 1); }
+    fun odd(n) { if (n == 0) return false; return even(n - 1); }
+    print(even(10));
+    { print(f); fun f() { return 1; } }
+}
+outer();
+print("after");
+""",
+    'hoisted function assigned before its declaration' : """
+fun outer() { fun g() { f = 2; } g(); fun f() { return 1; } }
+outer();
+print("after");
+""",
+    'lambda as a statement' : """
+fun (x) => x;
+print("after");
+fun f() { fun (x) => x; var y = 5; return y; }
+print(f());
+""",
+    'for loop declaring its variable under an if' : """
+fun f(c) { if (c) for (var i = 0; i < 1; i = i + 1) print("loop"); var y = 5; print(y); }
+f(false);
+f(true);
+""",
+    'for loop declaring its variable inside another loop' : """
+fun f() { var n = 0; while (n < 3) for (var i = 0; i < 1; i = i + 1) n = n + 1; print(n); }
+f();
+var last = nil;
+for (var i = 0; i < 3; i = i + 1) last = fun () => i;
+print(last());
+""",
+}
+
+
+def run_program(file, source, engine):
+    """run a program in-process, returning everything it printed (including error reports)"""
+    interpreter_lox = interpreter.Interpreter()
+    interpreter_lox.state.current_file_name = file
+    output = io.StringIO()
+    stdin, clock = sys.stdin, loxcallable.time
+    sys.stdin = io.StringIO(STDIN)
+    loxcallable.time = lambda : 0.0 # the examples print timings, which would never match
+    try:
+        with contextlib.redirect_stdout(output):
+            run.run(source, interpreter_lox, engine)
+    finally:
+        sys.stdin, loxcallable.time = stdin, clock
+    return output.getvalue()
+
+
+def main():
+    engines = sys.argv[1:] or ['vm', 'closure']
+    failures = 0
+    programs = [(os.path.basename(file), file, open(file).read()) for file in sorted(glob.glob(EXAMPLES))]
+    programs += [(name, '<test>', source) for name, source in PROGRAMS.items()]
+    for name, file, source in programs:
+        expected = run_program(file, source, 'tree')
+        for engine in engines:
+            if (actual := run_program(file, source, engine)) == expected:
+                print(f"ok    {engine:8} {name}")
+            else:
+                failures += 1
+                print(f"FAIL  {engine:8} {name}")
+                print(f"--- tree\n{expected}--- {engine}\n{actual}")
+    print(f"\n{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()